@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
 
 import threading
+from simulation import REAL_TIME
 
 # Implementation based on a StackOverflow answer by @NPE:
 # https://stackoverflow.com/a/26586865/656767
 
 class BlockingDict:
-    def __init__(self):
-        self._data = {}
-        self._cv = threading.Condition()
+    # Any mapping with get, "in", item assignment and deletion can hold the
+    # data, for example a TTLCache to make entries expire.  Timeouts are
+    # measured by clock, which may be a simulation.Scheduler.
+    def __init__(self, data=None, *, clock=REAL_TIME):
+        self._data = {} if data is None else data
+        self._clock = clock
+        self._lock = threading.RLock()
+        # Each key being waited on gets its own condition, so a put only wakes
+        # the threads waiting for that key.  Values are [condition, waiters].
+        self._waiting = {}
 
     # Implements "bd[key]" (blocking, no timeout)
     def __getitem__(self, key):
@@ -20,16 +28,31 @@ class BlockingDict:
 
     # Implements "del bd[key]"
     def __delitem__(self, key):
-        with self._cv:
+        with self._lock:
             del self._data[key]
 
+    # Implements "key in bd" (never blocks)
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
     def put(self, key, value):
-        with self._cv:
+        with self._lock:
             self._data[key] = value
-            self._cv.notify_all()
+            waiting = self._waiting.get(key)
+            if waiting is not None:
+                waiting[0].notify_all()
 
     def get(self, key, default=None, *, timeout=None):
-        with self._cv:
-            self._cv.wait_for(lambda: key in self._data, timeout=timeout)
+        with self._lock:
+            if key not in self._data and timeout != 0:
+                waiting = self._waiting.setdefault(key, [threading.Condition(self._lock), 0])
+                waiting[1] += 1
+                try:
+                    self._clock.wait_for(waiting[0], lambda: key in self._data, timeout)
+                finally:
+                    waiting[1] -= 1
+                    if waiting[1] == 0:
+                        del self._waiting[key]
             # This will return default if timed out
             return self._data.get(key, default)
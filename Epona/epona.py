@@ -1,19 +1,157 @@
 #!/usr/bin/env python3
 
+import asyncio
+import struct
 import threading
-from ipaddress import IPv4Address, IPv4Interface, IPv4Network
-from physical import Adapter, MultiportNode, BROADCAST_MAC, MARE_PROTONUM
+import zlib
+from collections import deque
+from blockingdict import BlockingDict
+from physical import Adapter, AsyncAdapter, MultiportNode, BROADCAST_MAC, MARE_PROTONUM
+from simulation import REAL_TIME
+from ttlcache import TTLCache
 
+#Checksum algorithm identifiers, carried in the first byte of every frame
+CHECKSUM_XOR = 0
+CHECKSUM_CRC32 = 1
 
-class EponaAdapter(Adapter):
+#Switching table defaults, in seconds and entries
+MAC_AGING_TIME = 300.0
+MAC_TABLE_SIZE = 8192
 
-    def __init__(self, *args, **kwargs):
+#MARE waits this many seconds for a reply before retrying, and gives up after this many requests
+MARE_TIMEOUT = 0.1
+MARE_RETRIES = 3
+#Datagrams held per unresolved IP while asynchronous resolution runs, oldest dropped first
+MARE_QUEUE_LENGTH = 64
+
+#MARE cache defaults: entries live MARE_CACHE_TIME seconds, and one still in use is
+#refreshed once it has less than MARE_REFRESH_TIME seconds (or a quarter of its
+#lifetime, if that is shorter) left
+MARE_CACHE_TIME = 60.0
+MARE_REFRESH_TIME = 5.0
+MARE_CACHE_SIZE = 1024
+#IPs that failed to resolve fail fast for this many seconds without new requests
+MARE_HOLD_DOWN = 1.0
+
+
+class EponaAdapterMixin:
+    """
+    The parts of an EPONA adapter which do no I/O, shared by EponaAdapter and
+    AsyncEponaAdapter: addresses, the MARE caches, deciding what to do with
+    received frames, and choosing the next hop.  Sending and waiting, which
+    block in one and await in the other, are left to the adapters.
+    """
+
+    def __init__(self, *args, checksumAlgorithm=CHECKSUM_CRC32, mareCacheTime=MARE_CACHE_TIME,
+                 mareCacheSize=MARE_CACHE_SIZE, mareHoldDown=MARE_HOLD_DOWN, clock=REAL_TIME, **kwargs):
         super().__init__(*args, **kwargs)
+        #Every timeout and timer runs against this clock, which may be a simulation.Scheduler
+        self.clock = clock
+        #Algorithm used for frames this adapter sends, receivers verify with whichever one a frame names
+        self.checksumAlgorithm = checksumAlgorithm
+        #Addresses in the forms the send path needs, worked out once here rather than per datagram
+        self.ipAdr = self.iface.ip.packed
+        self.networkAdr = int(self.iface.network.network_address)
+        self.netmask = int(self.iface.network.netmask)
+        self.gatewayIpAdr = self.gateway.packed
         #key: source IP addr
         #value: source Mac addr
-        self.arpTable = dict()
-        self.arpMessageRecieved = False
-        self.timeout = threading.Event()
+        #Entries expire mareCacheTime seconds after the last reply for them, and
+        #the least recently used one makes way once the cache is full.
+        self.arpCache = TTLCache(mareCacheSize, mareCacheTime, timer=clock.now)
+        #Entries in use are refreshed once they have this long left; short lifetimes
+        #get a proportionally short window so not every use triggers a refresh
+        self.mareRefreshTime = min(MARE_REFRESH_TIME, mareCacheTime / 4)
+        #IP addrs with a refresh request in flight
+        self.refreshing = TTLCache(mareCacheSize, MARE_TIMEOUT, timer=clock.now)
+        #IP addrs that recently failed to resolve
+        self.unreachable = TTLCache(mareCacheSize, mareHoldDown, timer=clock.now)
+
+    def encodeFrame(self, protonum, dst, dgram):
+        return Frame(protonum, dst, self.hwaddr, dgram, self.checksumAlgorithm).toBytes()
+
+    def acceptFrame(self, frame):
+        """
+        Decodes a received frame, returning it if it is intact and either a
+        MARE frame or addressed to this adapter, and None otherwise.
+        """
+        completeFrame = Frame.toFrame(frame)
+        if not completeFrame.ConfirmChecksum():
+            return None
+        if (completeFrame.protocol == MARE_PROTONUM or
+                self.hwaddr == completeFrame.dstMacAdr or BROADCAST_MAC == completeFrame.dstMacAdr):
+            return completeFrame
+        return None
+
+    def onSubnet(self, addr):
+        return int.from_bytes(addr, "big") & self.netmask == self.networkAdr
+
+    def nextHop(self, addr):
+        """Returns the IP addr to resolve for a datagram to addr"""
+        if not self.onSubnet(addr): #Sends to the nearest gateway router
+            return self.gatewayIpAdr
+        return addr
+
+    def mareFrameReceived(self, frame):
+        """
+        Caches the mapping carried by a MARE frame meant for this adapter.
+        Returns (IP addr, datagram) for the reply to send home, or None if
+        no reply is due.
+        """
+        completeFrame = ArpFrame.toFrame(frame.datagram)
+        if completeFrame.isSuccess and completeFrame.sourceIpAdr == completeFrame.dstIpAdr: #Gratuitous announcement
+            if completeFrame.sourceIpAdr != self.ipAdr and self.onSubnet(completeFrame.sourceIpAdr):
+                self.cacheMapping(completeFrame.sourceIpAdr, completeFrame.sourceMacAdr)
+        elif completeFrame.dstIpAdr == self.ipAdr: #The correct IP destination has been found
+            self.cacheMapping(completeFrame.sourceIpAdr, completeFrame.sourceMacAdr)
+            if completeFrame.isSuccess == b'0xff' and completeFrame.dstMacAdr == self.hwaddr:
+                return None
+            return (completeFrame.sourceIpAdr,
+                    ArpFrame(completeFrame.sourceMacAdr, self.hwaddr, completeFrame.sourceIpAdr,
+                             self.ipAdr, True).toBytes())
+        return None
+
+    def refreshDue(self, addr):
+        """
+        Decides whether to ask addr to confirm its mapping: only shortly
+        before the cached one expires, so that addresses in use never block
+        on resolution, and at most once per MARE_TIMEOUT.
+        """
+        expiry = self.arpCache.expiry(addr)
+        if expiry is None or expiry - self.clock.now() > self.mareRefreshTime:
+            return False
+        if addr in self.refreshing:
+            return False
+        self.refreshing[addr] = True
+        return True
+
+    def arpRequest(self, addr):
+        return ArpFrame(self.hwaddr, self.hwaddr, addr, self.ipAdr).toBytes()
+
+    def arpAnnouncement(self):
+        return ArpFrame(BROADCAST_MAC, self.hwaddr, self.ipAdr, self.ipAdr, True).toBytes()
+
+class EponaAdapter(EponaAdapterMixin, Adapter):
+
+    def __init__(self, *args, asyncResolution=False, gratuitousMare=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        #With asyncResolution, output_ip never blocks: datagrams for unresolved
+        #IPs wait in pendingPackets and are sent once the MARE reply arrives
+        self.asyncResolution = asyncResolution
+        #Announce our own mapping whenever we are plugged in, so peers never have to ask for it
+        self.gratuitousMare = gratuitousMare
+        #Resolvers wait on the key for their own IP, so each one wakes only for its own reply.
+        self.arpTable = BlockingDict(self.arpCache, clock=self.clock)
+        #key: IP addr being resolved
+        #value: time at which its resolution gives up
+        self.pendingResolutions = dict()
+        self.pendingLock = threading.Lock()
+        #key: IP addr being resolved in the background
+        #value: deque of (protonum, dgram) waiting to be sent there
+        self.pendingPackets = dict()
+        #Datagrams asynchronous resolution could not deliver: queued for an
+        #unreachable IP, or pushed out of a full queue
+        self.datagramsDropped = 0
 
     def output(self, protonum, dst, dgram):
         """
@@ -21,36 +159,43 @@ class EponaAdapter(Adapter):
         destination host. Provides the protocol number, destination MAC
         address, and datagram contents as bytes.
         """
-        frame = Frame(protonum, dst, self.hwaddr, dgram)
-        self.tx(frame.toBytes())
+        self.tx(self.encodeFrame(protonum, dst, dgram))
 
     def rx(self, frame):
         """
         Called when a frame arrives at the adapter.  Provides the frame
         contents as bytes.
         """
-        completeFrame = Frame.toFrame(frame)
-        if not completeFrame.ConfirmChecksum():
+        completeFrame = self.acceptFrame(frame)
+        if completeFrame is None:
             return
         elif completeFrame.protocol == MARE_PROTONUM:
-            self.arpFrameRecievedProcedure(frame)
-        elif (self.hwaddr == completeFrame.dstMacAdr or BROADCAST_MAC == completeFrame.dstMacAdr):
-            self.input(completeFrame.protocol, completeFrame.datagram)
+            self.arpFrameRecievedProcedure(completeFrame)
+        else:
+            #The network layer gets its own copy, every hop before this one shares the buffer
+            self.input(completeFrame.protocol, bytes(completeFrame.datagram))
     
+    def plugged(self):
+        if self.gratuitousMare:
+            self.announce()
+
+    def announce(self):
+        """
+        Broadcasts a gratuitous MARE reply carrying this adapter's own
+        mapping.  Should be called again whenever the adapter's address
+        changes.
+        """
+        self.output(MARE_PROTONUM, BROADCAST_MAC, self.arpAnnouncement())
+
     def arpFrameRecievedProcedure(self, frame):
-        completeFrame = ArpFrame.toFrame(Frame.toFrame(frame).datagram)
-        if completeFrame.dstIpAdr == self.iface.ip.packed: #The correct IP destination has been found
-            self.arpTable[completeFrame.sourceIpAdr] = completeFrame.sourceMacAdr
-            if completeFrame.isSuccess == b'0xff' and completeFrame.dstMacAdr == self.hwaddr:
-                self.successfulArpMessageRecieved()
-                return
-            self.output_ip(MARE_PROTONUM, completeFrame.sourceIpAdr, 
-                           ArpFrame(completeFrame.sourceMacAdr, self.hwaddr, completeFrame.sourceIpAdr, 
-                                    self.iface.ip.packed, True).toBytes()) #Send home
+        reply = self.mareFrameReceived(frame)
+        if reply is not None:
+            self.output_ip(MARE_PROTONUM, *reply) #Send home
     
-    def successfulArpMessageRecieved(self):
-        self.arpMessageRecieved = True
-        self.timeout.set()
+    def cacheMapping(self, ipAdr, macAdr):
+        self.arpTable[ipAdr] = macAdr
+        self.unreachable.pop(ipAdr)
+        self.flushPendingPackets(ipAdr, macAdr)
 
     def output_ip(self, protonum, addr, dgram):
         """
@@ -58,110 +203,418 @@ class EponaAdapter(Adapter):
         destination host.  Provides the protocol number, destination IPv4
         address as four bytes, and datagram contents as bytes.
         """
-        if IPv4Address(addr) not in self.iface.network: #Sends to the nearest gateway router
-            if self.gateway.packed not in self.arpTable:
-                self.arpIpDiscoverProcess(self.gateway.packed)
-            self.output_ip(protonum, self.gateway.packed, dgram)
-        elif addr in self.arpTable:
-            self.output(protonum, self.arpTable[addr], dgram)
+        addr = self.nextHop(addr)
+        dstMacAdr = self.arpTable.get(addr, timeout=0)
+        if dstMacAdr is not None:
+            self.refreshArpEntry(addr, dstMacAdr)
         else:
-            self.arpIpDiscoverProcess(addr)
-            self.output_ip(protonum, addr, dgram)
+            if self.asyncResolution:
+                self.queuePendingPacket(protonum, addr, dgram)
+                return
+            dstMacAdr = self.arpIpDiscoverProcess(addr)
+        self.output(protonum, dstMacAdr, dgram)
 
-    def arpIpDiscoverProcess(self, addr):
-        arpFrame = ArpFrame(self.hwaddr, self.hwaddr, addr, self.iface.packed)
-        arpFrameBytes = arpFrame.toBytes()
-        count = 3
-        self.timeout.clear()
-        while count > 0:
-            self.output(MARE_PROTONUM, BROADCAST_MAC, arpFrameBytes)
-            self.timeout.wait(0.1)
-            if self.arpMessageRecieved:
-                self.arpMessageRecieved = False
+    def refreshArpEntry(self, addr, dstMacAdr):
+        """
+        Asks addr to confirm its mapping when it is due, with a request sent
+        straight to the known MAC address rather than broadcast.
+        """
+        if self.refreshDue(addr):
+            self.sendArpRequest(addr, dstMacAdr)
+
+    def sendArpRequest(self, addr, dstMacAdr=BROADCAST_MAC):
+        self.output(MARE_PROTONUM, dstMacAdr, self.arpRequest(addr))
+
+    def queuePendingPacket(self, protonum, addr, dgram):
+        """
+        Parks a datagram until addr is resolved, starting a background
+        resolution if this is the first datagram waiting for it.
+        """
+        if addr in self.unreachable:
+            self.datagramsDropped += 1
+            return
+        with self.pendingLock:
+            queue = self.pendingPackets.get(addr)
+            start = queue is None
+            if start:
+                queue = self.pendingPackets[addr] = deque(maxlen=MARE_QUEUE_LENGTH)
+            elif len(queue) == MARE_QUEUE_LENGTH:
+                #The oldest datagram makes way
+                self.datagramsDropped += 1
+            queue.append((protonum, dgram))
+        if start:
+            self.backgroundDiscoverProcess(addr, queue, MARE_RETRIES)
+
+    def backgroundDiscoverProcess(self, addr, queue, count):
+        """
+        Sends one of the count remaining MARE requests for the datagrams in
+        queue, and schedules the next attempt on the clock.  Nothing ever
+        blocks, so any number of resolutions run side by side, also in
+        simulated time.  The reply flushes the queue through cacheMapping.
+        """
+        with self.pendingLock:
+            if self.pendingPackets.get(addr) is not queue:
+                #Resolved (and flushed) since the last attempt
+                return
+            if count == 0:
+                #Nobody is left to report the failure to, so the datagrams are dropped
+                del self.pendingPackets[addr]
+                self.unreachable[addr] = True
+                self.datagramsDropped += len(queue)
                 return
-            count -= 1
-        raise self.NoRouteToHost
+        self.sendArpRequest(addr)
+        self.clock.call_later(MARE_TIMEOUT, self.backgroundDiscoverProcess, addr, queue, count - 1)
+
+    def flushPendingPackets(self, addr, dstMacAdr):
+        with self.pendingLock:
+            queue = self.pendingPackets.pop(addr, None)
+        if queue is not None:
+            for protonum, dgram in queue:
+                self.output(protonum, dstMacAdr, dgram)
+
+    def arpIpDiscoverProcess(self, addr):
+        """
+        Broadcasts MARE requests for addr until a reply arrives, and returns
+        the resolved MAC address.  Only the first caller for an address sends
+        requests; later callers wait for the same reply.  Addresses that
+        recently failed to resolve fail again at once.
+        """
+        if addr in self.unreachable:
+            raise self.NoRouteToHost
+        with self.pendingLock:
+            deadline = self.pendingResolutions.get(addr)
+            if deadline is None:
+                self.pendingResolutions[addr] = self.clock.now() + MARE_TIMEOUT * MARE_RETRIES
+        if deadline is not None:
+            dstMacAdr = self.arpTable.get(addr, timeout=max(deadline - self.clock.now(), 0))
+            if dstMacAdr is None:
+                raise self.NoRouteToHost
+            return dstMacAdr
+
+        try:
+            count = MARE_RETRIES
+            while count > 0:
+                self.sendArpRequest(addr)
+                dstMacAdr = self.arpTable.get(addr, timeout=MARE_TIMEOUT)
+                if dstMacAdr is not None:
+                    return dstMacAdr
+                count -= 1
+            self.unreachable[addr] = True
+            raise self.NoRouteToHost
+        finally:
+            with self.pendingLock:
+                del self.pendingResolutions[addr]
+
+class AsyncEponaAdapter(EponaAdapterMixin, AsyncAdapter):
+    """
+    EponaAdapter for asyncio links.  output_ip is a coroutine, and a MARE
+    resolution in progress is a future which the reply completes, so a
+    sender waiting for one costs a suspended task rather than a thread.
+    MARE timeouts are awaited on the event loop, while cache lifetimes follow
+    clock, whose default (REAL_TIME) keeps the same monotonic time as the
+    standard event loop.
+    """
 
-class EponaSwitch(MultiportNode):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        #key: IP addr being resolved
+        #value: future completed with its MAC addr, or with None if resolution failed
+        self.pendingResolutions = dict()
+
+    async def output(self, protonum, dst, dgram):
+        await self.tx(self.encodeFrame(protonum, dst, dgram))
+
+    async def rx(self, frame):
+        completeFrame = self.acceptFrame(frame)
+        if completeFrame is None:
+            return
+        elif completeFrame.protocol == MARE_PROTONUM:
+            await self.arpFrameRecievedProcedure(completeFrame)
+        else:
+            self.input(completeFrame.protocol, bytes(completeFrame.datagram))
+
+    async def announce(self):
+        """
+        Broadcasts a gratuitous MARE reply carrying this adapter's own
+        mapping.  There is no gratuitousMare option, since plugging in is not
+        a coroutine: await this after plug() instead.
+        """
+        await self.output(MARE_PROTONUM, BROADCAST_MAC, self.arpAnnouncement())
+
+    async def arpFrameRecievedProcedure(self, frame):
+        reply = self.mareFrameReceived(frame)
+        if reply is not None:
+            await self.output_ip(MARE_PROTONUM, *reply) #Send home
+
+    def cacheMapping(self, ipAdr, macAdr):
+        self.arpCache[ipAdr] = macAdr
+        self.unreachable.pop(ipAdr)
+        resolution = self.pendingResolutions.get(ipAdr)
+        if resolution is not None and not resolution.done():
+            resolution.set_result(macAdr)
+
+    async def output_ip(self, protonum, addr, dgram):
+        """
+        Sends a datagram to an IPv4 address given as four bytes, first
+        resolving it (or the gateway's) with MARE if necessary.  Raises
+        NoRouteToHost if it cannot be resolved.
+        """
+        addr = self.nextHop(addr)
+        dstMacAdr = self.arpCache.get(addr)
+        if dstMacAdr is not None:
+            if self.refreshDue(addr):
+                await self.sendArpRequest(addr, dstMacAdr)
+        else:
+            dstMacAdr = await self.arpIpDiscoverProcess(addr)
+        await self.output(protonum, dstMacAdr, dgram)
+
+    async def sendArpRequest(self, addr, dstMacAdr=BROADCAST_MAC):
+        await self.output(MARE_PROTONUM, dstMacAdr, self.arpRequest(addr))
+
+    async def arpIpDiscoverProcess(self, addr):
+        """
+        Broadcasts MARE requests for addr until a reply arrives, and returns
+        the resolved MAC address.  Only the first caller for an address sends
+        requests; later callers await the same future.
+        """
+        if addr in self.unreachable:
+            raise self.NoRouteToHost
+        resolution = self.pendingResolutions.get(addr)
+        if resolution is not None:
+            #Shielded, so a caller being cancelled leaves the others' resolution alone
+            dstMacAdr = await asyncio.shield(resolution)
+            if dstMacAdr is None:
+                raise self.NoRouteToHost
+            return dstMacAdr
+
+        resolution = self.pendingResolutions[addr] = asyncio.get_running_loop().create_future()
+        try:
+            for _ in range(MARE_RETRIES):
+                await self.sendArpRequest(addr)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(resolution), MARE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    pass
+            self.unreachable[addr] = True
+            raise self.NoRouteToHost
+        finally:
+            del self.pendingResolutions[addr]
+            if not resolution.done():
+                resolution.set_result(None)
+
+class EponaSwitch(MultiportNode):
+    def __init__(self, *args, cutThrough=False, macAgingTime=MAC_AGING_TIME,
+                 macTableSize=MAC_TABLE_SIZE, mareProxy=False, clock=REAL_TIME, **kwargs):
+        super().__init__(*args, **kwargs)
         #key: source port MAC addr
         #value: port
-        self.switchingTable = dict()
+        #Entries are forgotten macAgingTime seconds after their MAC was last seen,
+        #and the least recently used entry makes way once the table is full
+        self.switchingTable = TTLCache(macTableSize, macAgingTime, timer=clock.now)
+        self.stationMoves = 0
+        #Cut-through switches forward as soon as the destination is known and
+        #leave dropping corrupted frames to the adapter at the far end
+        self.cutThrough = cutThrough
+        self.corruptFramesDropped = 0
+        self.corruptFramesForwarded = 0
+        #A MARE proxy learns IP addrs from the MARE traffic it sees and answers
+        #requests for them itself instead of flooding the request
+        self.mareProxy = mareProxy
+        #key: IP addr
+        #value: MAC addr
+        self.mareTable = TTLCache(MARE_CACHE_SIZE, MARE_CACHE_TIME, timer=clock.now)
+        self.mareRequestsAnswered = 0
 
     def rx(self, port, frame):
         """
         Called when a frame arrives at any port.  Provides the port number as
         an int and the frame contents as bytes.
         """
-        completeFrame = Frame.toFrame(frame)
-        if not completeFrame.ConfirmChecksum():
+        if len(frame) < Frame.HEADER.size:
+            return
+        snoop = self.mareProxy and Frame.peekProtocol(frame) == MARE_PROTONUM
+        #MARE frames are tiny, so a proxy checks them before snooping even in cut-through mode
+        storeAndForward = snoop or not self.cutThrough
+        if storeAndForward and not Frame.ConfirmBufferChecksum(frame):
+            self.corruptFramesDropped += 1
             return 
-        if completeFrame.dstMacAdr in self.switchingTable:
-            if self.switchingTable[completeFrame.dstMacAdr] != port:
-                self.forward(self.switchingTable[completeFrame.dstMacAdr], frame)
+        #Only the addresses are needed, the frame itself is forwarded untouched
+        dstMacAdr, sourceMacAdr = Frame.peekAddresses(frame)
+        if storeAndForward:
+            self.learn(sourceMacAdr, port)
+        if snoop and self.mareProxyProcedure(port, frame, dstMacAdr):
             return
-        self.switchingTable[completeFrame.sourceMacAdr] = port
-        self.broadcast(frame, port)
+        outport = self.switchingTable.get(dstMacAdr)
+        if outport is None:
+            self.broadcast(frame, port)
+        elif outport != port:
+            self.forward(outport, frame)
+        if not storeAndForward:
+            #The whole frame has gone by now, so it can finally be checked
+            if Frame.ConfirmBufferChecksum(frame):
+                self.learn(sourceMacAdr, port)
+            elif outport != port:
+                self.corruptFramesForwarded += 1
+
+    def mareProxyProcedure(self, port, frame, dstMacAdr):
+        """
+        Records the sender's mapping from a verified MARE frame, and answers
+        it from the switch if it is a broadcast request for a known host on
+        another port.  Returns True if the request was answered and should
+        not be forwarded.
+        """
+        datagram = Frame.toFrame(frame).datagram
+        if len(datagram) < ArpFrame.HEADER.size:
+            return False
+        arpFrame = ArpFrame.toFrame(datagram)
+        #Requests and replies both carry the sender's own mapping
+        self.mareTable[arpFrame.sourceIpAdr] = arpFrame.sourceMacAdr
+        #Unicast requests are refreshes, which only the target itself can confirm
+        if arpFrame.isSuccess or dstMacAdr != BROADCAST_MAC:
+            return False
+        targetMacAdr = self.mareTable.get(arpFrame.dstIpAdr)
+        if targetMacAdr is None or self.switchingTable.get(targetMacAdr) in (None, port):
+            #Unknown hosts, and hosts on the requester's own link, answer for themselves
+            return False
+        reply = ArpFrame(arpFrame.sourceMacAdr, targetMacAdr, arpFrame.sourceIpAdr, arpFrame.dstIpAdr, True)
+        self.forward(port, Frame(MARE_PROTONUM, arpFrame.sourceMacAdr, targetMacAdr, reply.toBytes()).toBytes())
+        self.mareRequestsAnswered += 1
+        return True
+
+    def learn(self, macAdr, port):
+        """
+        Records that macAdr lives on port, restarting its aging timer.  A MAC
+        already known on a different port has moved, so the new port wins.
+        """
+        knownPort = self.switchingTable.get(macAdr)
+        if knownPort is not None and knownPort != port:
+            self.stationMoves += 1
+        self.switchingTable[macAdr] = port
 
     def broadcast(self, frame, port):
-        index = 0
-        while index < self.nports:
-            if index != port:
-                self.forward(index, frame)
-            index += 1
+        self.flood(port, frame)
         
+def xorChecksum(data, value=0):
+    """
+    Folds every byte of data into value with XOR.  Takes the same arguments as
+    zlib.crc32 so that either can be run incrementally over several buffers.
+    """
+    for byte in data:
+        value ^= byte
+    return value
+
 class Frame():
     """
     Frame Formatting:
-        Protocol Number = 6 bytes
+        Checksum Algorithm = 1 byte
+        Protocol Number = 5 bytes
         Destination MAC Address = 6 bytes
         Source MAC Address = 6 bytes
         Checksum = 4 bytes
         Datagram
     """
 
-    def __init__(self, protocol, dstMacAdr, sourceMacAdr, datagram) -> None:
+    #The 5-byte protocol number is packed as a 1-byte high part and a 4-byte low part
+    HEADER = struct.Struct(">BBI6s6s4s")
+    ADDRESSES = struct.Struct(">6s6s")
+    ADDRESSES_OFFSET = 6
+    CHECKSUM_OFFSET = 18
+
+    #key: checksum algorithm identifier
+    #value: function(data, value) continuing a checksum over data
+    CHECKSUMS = {
+        CHECKSUM_XOR: xorChecksum,
+        CHECKSUM_CRC32: zlib.crc32,
+    }
+
+    def __init__(self, protocol, dstMacAdr, sourceMacAdr, datagram, checksumAlgorithm=CHECKSUM_CRC32) -> None:
+        if checksumAlgorithm not in Frame.CHECKSUMS:
+            raise ValueError("Unknown checksum algorithm")
+        self.checksumAlgorithm = checksumAlgorithm
         self.protocol = protocol
         self.dstMacAdr = dstMacAdr
         self.sourceMacAdr = sourceMacAdr
         self.datagram = datagram
+        self.buffer = None
         self.checksum = self.CreateChecksum()
 
     def toFrame(byteStream):
-        protocol = int.from_bytes(byteStream[0:6], "big")
-        dstMacAdr = byteStream[6:12]
-        sourceMacAdr = byteStream[12:18]
-        checksum = byteStream[18:22]
-        datagram = byteStream[22:]
-        
-        frame = Frame(protocol, dstMacAdr, sourceMacAdr, datagram)
-        frame.checksum = checksum
+        """
+        Decodes a received frame without copying it.  The header fields and
+        the datagram are memoryviews over the original buffer, which is kept
+        in self.buffer.
+        """
+        view = memoryview(byteStream).toreadonly()
+
+        frame = Frame.__new__(Frame)
+        frame.buffer = view
+        frame.checksumAlgorithm = view[0] if len(view) else None
+        frame.protocol = int.from_bytes(view[1:6], "big")
+        frame.dstMacAdr = view[6:12]
+        frame.sourceMacAdr = view[12:18]
+        frame.checksum = view[18:22]
+        frame.datagram = view[22:]
         return frame
 
+    def peekProtocol(byteStream):
+        """
+        Reads the protocol number from an encoded frame without decoding the
+        rest of it.
+        """
+        return int.from_bytes(byteStream[1:6], "big")
+
+    def peekAddresses(byteStream):
+        """
+        Reads (dstMacAdr, sourceMacAdr) from their fixed offsets in an encoded
+        frame without decoding the rest of it.
+        """
+        return Frame.ADDRESSES.unpack_from(byteStream, Frame.ADDRESSES_OFFSET)
+
     def toBytes(self):
-        byteResult = b''
-        byteResult += self.protocol.to_bytes(6, "big")
-        byteResult += self.dstMacAdr
-        byteResult += self.sourceMacAdr
-        byteResult += self.checksum
-        byteResult += self.datagram
+        """
+        Encodes the frame in a single pass into a buffer preallocated to the
+        full frame length.
+        """
+        byteResult = bytearray(Frame.HEADER.size + len(self.datagram))
+        #struct's "s" fields only take bytes, while decoded frames hold memoryviews
+        Frame.HEADER.pack_into(byteResult, 0, self.checksumAlgorithm, self.protocol >> 32, self.protocol & 0xffffffff,
+                               bytes(self.dstMacAdr), bytes(self.sourceMacAdr), bytes(self.checksum))
+        byteResult[Frame.HEADER.size:] = self.datagram
         return byteResult
 
 #region ChecksumHelperMethods
 
     def CreateChecksum(self):
-        self.checksum= b''
-        checksum = 0
-        checksumData = self.toBytes()
-        for byte in checksumData:
-            checksum ^= byte
+        """
+        Computes the checksum from the frame's fields with the frame's
+        checksum algorithm, covering every byte of the frame except the
+        checksum itself.
+        """
+        checksumFunction = Frame.CHECKSUMS[self.checksumAlgorithm]
+        checksum = checksumFunction(bytes((self.checksumAlgorithm,)) + self.protocol.to_bytes(5, "big"))
+        for field in (self.dstMacAdr, self.sourceMacAdr, self.datagram):
+            checksum = checksumFunction(field, checksum)
         return checksum.to_bytes(4, "big")
     
     def ConfirmChecksum(self):
-        originalChecksum = self.checksum
-        checksum = self.CreateChecksum()
-        return checksum == originalChecksum
+        if self.buffer is not None:
+            return Frame.ConfirmBufferChecksum(self.buffer)
+        return self.CreateChecksum() == self.checksum
+
+    def ConfirmBufferChecksum(byteStream):
+        """
+        Verifies an encoded frame in place: one scan over the bytes on either
+        side of the checksum field, without decoding or copying anything.
+        """
+        view = memoryview(byteStream)
+        if len(view) < Frame.HEADER.size:
+            return False
+        checksumFunction = Frame.CHECKSUMS.get(view[0])
+        if checksumFunction is None:
+            return False
+        checksum = checksumFunction(view[:Frame.CHECKSUM_OFFSET])
+        checksum = checksumFunction(view[Frame.HEADER.size:], checksum)
+        return checksum == int.from_bytes(view[Frame.CHECKSUM_OFFSET:Frame.HEADER.size], "big")
 
 #endregion
 
@@ -175,6 +628,8 @@ class ArpFrame():
         Is Successful Flag = 1 byte
     """
 
+    HEADER = struct.Struct(">6s6s4s4s")
+
     def __init__(self, dstMacAdr, sourceMacAdr, dstIpAdr, sourceIpAdr, isSuccessfulFlag = False) -> None:
         self.dstMacAdr = dstMacAdr
         self.sourceMacAdr = sourceMacAdr
@@ -183,6 +638,7 @@ class ArpFrame():
         self.isSuccess = b'0xff' if isSuccessfulFlag else b''
 
     def toFrame(byteStream):
+        byteStream = bytes(byteStream) #MARE frames are tiny, so copying out of the frame buffer is cheap
         dstMacAdr = byteStream[0:6]
         sourceMacAdr = byteStream[6:12]
         dstIpAdr = byteStream[12:16]
@@ -191,10 +647,8 @@ class ArpFrame():
         return ArpFrame(dstMacAdr, sourceMacAdr, dstIpAdr, sourceIpAdr, isSuccess)
 
     def toBytes(self):
-        byteResult = b''
-        byteResult += self.dstMacAdr
-        byteResult += self.sourceMacAdr
-        byteResult += self.dstIpAdr
-        byteResult += self.sourceIpAdr
-        byteResult += self.isSuccess
+        byteResult = bytearray(ArpFrame.HEADER.size + len(self.isSuccess))
+        ArpFrame.HEADER.pack_into(byteResult, 0, bytes(self.dstMacAdr), bytes(self.sourceMacAdr),
+                                  bytes(self.dstIpAdr), bytes(self.sourceIpAdr))
+        byteResult[ArpFrame.HEADER.size:] = self.isSuccess
         return byteResult
\ No newline at end of file
@@ -2,14 +2,31 @@
 
 from abc import abstractmethod, ABC
 from collections.abc import ByteString
+import queue
 import random
 import os
+import selectors
+import socket
 import sys
+import threading
+import traceback
 from typing import Optional
 
+from sharedring import SharedRing, RING_SIZE
+
 BROADCAST_MAC = bytes.fromhex('ff ff ff ff ff ff')
 MARE_PROTONUM = 0x0806
 
+# Defaults for nodes with their own receive workers: frames waiting per node,
+# and seconds a sender waits for room before the frame is dropped
+RX_QUEUE_SIZE = 64
+RX_PUT_TIMEOUT = 1.0
+
+# Largest frame a DatagramLink carries (the largest UDP payload over IPv4),
+# and seconds its receiver thread waits before checking whether to stop
+MAX_DATAGRAM = 65507
+DATAGRAM_POLL_INTERVAL = 0.05
+
 
 def _hexdump(data):
     for ofs in range(0, len(data), 16):
@@ -23,9 +40,92 @@ def _hexdump(data):
 
 
 class Node(ABC):
+    # Frames are handled on the sender's thread unless start() has given the
+    # node its own inbound queue and workers
+    _inbox: Optional[queue.Queue] = None
+    _workers: tuple[threading.Thread, ...] = ()
+    rx_dropped = 0
+
     @abstractmethod
     def rx_link(self, link: 'CommunicationsLink', frame: ByteString): ...
 
+    def start(self, maxsize=RX_QUEUE_SIZE, workers=1, put_timeout=RX_PUT_TIMEOUT):
+        """
+        Gives the node a bounded inbound queue drained by its own worker
+        threads.  A sender finding the queue full waits up to put_timeout
+        seconds for room (backpressure), after which the frame is dropped and
+        counted in rx_dropped.  With more than one worker, frames may be
+        handled out of order.
+        """
+        if self._inbox is not None:
+            return
+        # Guards the switch between queued and synchronous delivery, and
+        # counts the senders part way through queueing a frame
+        self._rx_lock = threading.Condition()
+        self._senders = 0
+        self._inbox = queue.Queue(maxsize)
+        self._put_timeout = put_timeout
+        self._workers = tuple(threading.Thread(target=self._work, args=(self._inbox,), daemon=True)
+                              for _ in range(workers))
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        """Finishes the frames already queued and goes back to synchronous delivery"""
+        if self._inbox is None:
+            return
+        with self._rx_lock:
+            inbox, workers = self._inbox, self._workers
+            if inbox is None:
+                return
+            # Later frames are delivered synchronously, and the ones being
+            # queued are in before the workers are told to finish
+            self._inbox = None
+            self._workers = ()
+            self._rx_lock.wait_for(lambda: not self._senders)
+        for _ in workers:
+            inbox.put(None)
+        for worker in workers:
+            worker.join()
+
+    def drain(self):
+        """Waits until every frame queued for this node has been handled"""
+        if self._inbox is not None:
+            self._inbox.join()
+
+    def _receive(self, handler, *args):
+        inbox = None
+        if self._inbox is not None:
+            with self._rx_lock:
+                inbox = self._inbox
+                if inbox is not None:
+                    self._senders += 1
+        if inbox is None:
+            handler(*args)
+            return
+        try:
+            inbox.put((handler, args), timeout=self._put_timeout)
+            dropped = False
+        except queue.Full:
+            dropped = True
+        with self._rx_lock:
+            self._senders -= 1
+            self.rx_dropped += dropped
+            self._rx_lock.notify_all()
+
+    def _work(self, inbox):
+        while True:
+            item = inbox.get()
+            try:
+                if item is None:
+                    return
+                handler, args = item
+                handler(*args)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                inbox.task_done()
+
 
 class CommunicationsLink(ABC):
     @abstractmethod
@@ -39,16 +139,36 @@ class CommunicationsLink(ABC):
 
 
 class BroadcastLink(CommunicationsLink):
-    def __init__(self, name=None, debug=None):
+    def __init__(self, name=None, debug=None, clock=None, latency=0.0, bandwidth=None,
+                 queue_limit=None):
         if name is None:
             name = "link"
         if debug is None:
             debug = 'NET_DEBUG' in os.environ
+        if clock is None and (latency or bandwidth is not None or queue_limit is not None):
+            raise ValueError("Link timing model requires a clock")
         self._name = name
         self._debug = debug
+        # Without a clock frames are delivered before tx() returns; with one
+        # (such as a simulation.Scheduler) delivery is scheduled as an event
+        self._clock = clock
+        # Timing model: frames take turns on the medium, each occupying it for
+        # len * 8 / bandwidth seconds (bandwidth in bits per second, None for
+        # no serialization delay), and arrive latency seconds after they have
+        # been sent.  At most queue_limit frames may be waiting or being sent;
+        # any more are dropped.
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._queue_limit = queue_limit
+        self._busy_until = 0.0
+        self._queued = 0
         self._nodes: set[Node] = set()
         self._corrupt = False
 
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.frames_dropped = 0
+
     def attach(self, node: Node):
         self._nodes.add(node)
 
@@ -61,9 +181,28 @@ class BroadcastLink(CommunicationsLink):
     def tx(self, sender: Node, frame: ByteString):
         assert sender in self._nodes, "BroadcastLink received frame from unattached node"
 
+        frame = self._prepare(frame)
+        if frame is None:
+            return
+        if self._clock is None:
+            self._deliver(sender, frame)
+        else:
+            self._enqueue(sender, frame)
+        self._corrupt = False
+
+    def _prepare(self, frame: ByteString) -> Optional[bytes]:
+        """
+        Checks, counts and (if asked to) corrupts a frame about to go on the
+        link, returning the bytes to deliver or None if it was dropped.
+        """
         if not isinstance(frame, ByteString):
             raise TypeError("Link can only transmit bytes")
 
+        if self._queue_limit is not None and self._queued >= self._queue_limit:
+            # Tail drop
+            self.frames_dropped += 1
+            return None
+
         frame = bytes(frame)
         if self._corrupt:
             # Choose a random byte
@@ -76,10 +215,207 @@ class BroadcastLink(CommunicationsLink):
             print('Frame on link "%s"%s:' % (self._name, ' (CORRUPTED)' if self._corrupt else ''),
                   file=sys.stderr)
             _hexdump(frame)
-        for node in self._nodes:
+        self.frames_sent += 1
+        self.bytes_sent += len(frame)
+        return frame
+
+    def _enqueue(self, sender: Node, frame: bytes):
+        now = self._clock.now()
+        finish = max(now, self._busy_until)
+        if self._bandwidth is not None:
+            finish += len(frame) * 8 / self._bandwidth
+        self._busy_until = finish
+        self._queued += 1
+        self._clock.call_later(finish - now, self._sent, sender, frame)
+
+    def _sent(self, sender: Node, frame: bytes):
+        self._queued -= 1
+        if self._latency:
+            self._clock.call_later(self._latency, self._deliver, sender, frame)
+        else:
+            self._deliver(sender, frame)
+
+    def _deliver(self, sender: Node, frame: bytes):
+        for node in list(self._nodes):
             if node != sender:
                 node.rx_link(self, frame)
-        self._corrupt = False
+
+
+class SharedMemoryLink(BroadcastLink):
+    """
+    BroadcastLink whose nodes may live in several processes, called
+    endpoints.  Each endpoint writes the frames its nodes send to its own
+    lock-free single-producer/multi-consumer SharedRing, and poll() hands
+    the frames the other endpoints have written to the local nodes.  Frames
+    cross as raw bytes, with nothing pickled.
+
+    Create the link in one process and pass it to the others (pickling
+    attaches to the same rings), then call bind() with each process's own
+    endpoint number before attaching nodes.  When an endpoint's ring is full
+    because another endpoint has not polled, frames are dropped and counted
+    in frames_dropped.
+    """
+
+    def __init__(self, endpoints, name=None, debug=None, capacity=RING_SIZE, rings=None):
+        super().__init__(name, debug)
+        self._endpoints = endpoints
+        # Ring e is written by endpoint e and read by all the others
+        if rings is None:
+            rings = [SharedRing(create=True, capacity=capacity, consumers=endpoints - 1)
+                     for _ in range(endpoints)]
+        self._rings = rings
+        self._endpoint = None
+        # The ring has a single producer, but threads within the endpoint
+        # (such as the one polling) may all send frames
+        self._put_lock = threading.Lock()
+
+    def __reduce__(self):
+        return (SharedMemoryLink, (self._endpoints, self._name, self._debug, None, self._rings))
+
+    @property
+    def endpoints(self):
+        return self._endpoints
+
+    def bind(self, endpoint: int):
+        """Sets which endpoint this process is"""
+        if not 0 <= endpoint < self._endpoints:
+            raise IndexError("Invalid endpoint number")
+        self._endpoint = endpoint
+
+    def poll(self, limit=None) -> int:
+        """
+        Delivers frames the other endpoints have sent since the last poll (at
+        most limit from each) to the local nodes, returning how many there
+        were.
+        """
+        count = 0
+        for endpoint, ring in enumerate(self._rings):
+            if endpoint == self._endpoint:
+                continue
+            for frame in ring.drain(self._consumer(endpoint), limit):
+                super()._deliver(None, frame)
+                count += 1
+        return count
+
+    def close(self):
+        """Detaches this process from the link's shared memory"""
+        for ring in self._rings:
+            ring.close()
+
+    def unlink(self):
+        """Destroys the link's shared memory once every process has closed it"""
+        for ring in self._rings:
+            ring.unlink()
+
+    def _consumer(self, endpoint):
+        # Consumer number of this endpoint on the given endpoint's ring
+        return self._endpoint - (self._endpoint > endpoint)
+
+    def _deliver(self, sender: Node, frame: bytes):
+        assert self._endpoint is not None, "SharedMemoryLink used before bind()"
+        with self._put_lock:
+            sent = self._rings[self._endpoint].put(frame)
+        if not sent:
+            self.frames_dropped += 1
+        super()._deliver(sender, frame)
+
+
+class DatagramLink(BroadcastLink):
+    """
+    BroadcastLink whose nodes may live in separate processes or containers
+    on one machine, carrying frames between them as datagrams on localhost
+    UDP, or on Unix datagram sockets if address is a filesystem path.
+
+    Each process creates its own DatagramLink bound to its own address and
+    connect()s it to every other process's.  A frame sent on the link goes to
+    the local nodes and to each peer; poll(), or the receiver thread run by
+    start(), delivers the frames peers have sent.  A copy which the kernel
+    refuses (a full socket buffer or an oversized frame) is counted in
+    frames_dropped.
+    """
+
+    def __init__(self, address=('127.0.0.1', 0), name=None, debug=None, peers=()):
+        super().__init__(name, debug)
+        family = socket.AF_UNIX if isinstance(address, (str, bytes)) else socket.AF_INET
+        self._sock = socket.socket(family, socket.SOCK_DGRAM)
+        self._sock.bind(address)
+        self._sock.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ)
+        self._peers = list(peers)
+        self._receiver = None
+        self._stopping = threading.Event()
+
+    @property
+    def address(self):
+        return self._sock.getsockname()
+
+    def connect(self, address):
+        """Adds a peer for frames sent from this process"""
+        if address not in self._peers:
+            self._peers.append(address)
+
+    def poll(self, timeout=0, limit=None) -> int:
+        """
+        Waits up to timeout seconds for frames from peers, then delivers
+        every one waiting (or at most limit) to the local nodes, returning how
+        many there were.
+        """
+        if not self._selector.select(timeout):
+            return 0
+        count = 0
+        # Python has no recvmmsg, so the batch is a loop of non-blocking reads
+        # until the socket runs dry
+        while limit is None or count < limit:
+            try:
+                frame = self._sock.recv(MAX_DATAGRAM)
+            except BlockingIOError:
+                break
+            super()._deliver(None, frame)
+            count += 1
+        return count
+
+    def start(self):
+        """Starts a thread delivering frames from peers as they arrive"""
+        if self._receiver is not None:
+            return
+        self._stopping.clear()
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._receiver.start()
+
+    def stop(self):
+        if self._receiver is None:
+            return
+        self._stopping.set()
+        self._receiver.join()
+        self._receiver = None
+
+    def close(self):
+        self.stop()
+        address = self.address
+        self._selector.close()
+        self._sock.close()
+        if self._sock.family == socket.AF_UNIX:
+            os.unlink(address)
+
+    def _receive(self):
+        while not self._stopping.is_set():
+            self.poll(DATAGRAM_POLL_INTERVAL)
+
+    def _deliver(self, sender: Node, frame: bytes):
+        # Unix datagram sockets take frames larger than peers' receives read,
+        # which would arrive truncated, so the limit is enforced here for both
+        if len(frame) > MAX_DATAGRAM:
+            self.frames_dropped += len(self._peers)
+            super()._deliver(sender, frame)
+            return
+        # Python has no sendmmsg either, so each peer gets its own sendto
+        for peer in self._peers:
+            try:
+                self._sock.sendto(frame, peer)
+            except OSError:
+                self.frames_dropped += 1
+        super()._deliver(sender, frame)
 
 
 class Adapter(Node):
@@ -118,6 +454,11 @@ class Adapter(Node):
             self.unplug()
         self._link = link
         self._link.attach(self)
+        self.plugged()
+
+    # Called after the adapter is attached to a new link, for protocols which
+    # need to announce themselves
+    def plugged(self): ...
 
     def unplug(self):
         if self._link is None:
@@ -128,7 +469,7 @@ class Adapter(Node):
     def rx_link(self, link: CommunicationsLink, frame: ByteString):
         assert link is self._link, "Adapter received frame from unattached link"
 
-        self.rx(frame)
+        self._receive(self.rx, frame)
 
     def tx(self, frame):
         if self._link is None:
@@ -152,6 +493,13 @@ class MultiportNode(Node):
     def __init__(self, num_ports):
         self._nports = num_ports
         self._ports: list[Optional[CommunicationsLink]] = [None] * num_ports
+        # Reverse index of _ports, so the port a frame arrived on can be found
+        # without searching.  A link plugged into several ports maps to the
+        # lowest of them.
+        self._link_ports: dict[CommunicationsLink, int] = {}
+        # For each ingress port, the links on every other plugged-in port, so
+        # flooding skips empty ports without checking them
+        self._flood_links: list[tuple[CommunicationsLink, ...]] = [()] * num_ports
 
     # We use @property to make this value effectively read-only (by not
     # providing a corresponding setter method)
@@ -160,31 +508,40 @@ class MultiportNode(Node):
         return self._nports
 
     def plug(self, portnum: int, link: CommunicationsLink):
-        if portnum not in range(len(self._ports)):
+        if not 0 <= portnum < self._nports:
             raise IndexError("Invalid port number")
 
         self.unplug(portnum)
         self._ports[portnum] = link
+        self._link_ports[link] = min(portnum, self._link_ports.get(link, portnum))
+        self._update_flood_links()
         link.attach(self)
 
     def unplug(self, portnum: int):
-        if portnum not in range(len(self._ports)):
+        if not 0 <= portnum < self._nports:
             raise IndexError("Invalid port number")
 
         link = self._ports[portnum]
         if link is None:
             return
         self._ports[portnum] = None
+        if self._link_ports[link] == portnum:
+            del self._link_ports[link]
+            for other, other_link in enumerate(self._ports):
+                if other_link is link:
+                    self._link_ports[link] = other
+                    break
+        self._update_flood_links()
         link.detach(self)
 
     def rx_link(self, link: CommunicationsLink, frame: ByteString):
-        assert link in self._ports, "MultiportNode received frame from unattached link"
+        inport = self._link_ports.get(link)
+        assert inport is not None, "MultiportNode received frame from unattached link"
 
-        inport = self._ports.index(link)
-        self.rx(inport, frame)
+        self._receive(self.rx, inport, frame)
 
     def forward(self, outport: int, frame: ByteString):
-        if outport not in range(len(self._ports)):
+        if not 0 <= outport < self._nports:
             raise IndexError("Invalid port number")
 
         link = self._ports[outport]
@@ -192,5 +549,90 @@ class MultiportNode(Node):
             return
         link.tx(self, frame)
 
+    def flood(self, inport: int, frame: ByteString):
+        """Forwards the frame to every plugged-in port except inport"""
+        for link in self._flood_links[inport]:
+            link.tx(self, frame)
+
+    def _update_flood_links(self):
+        plugged = [(portnum, link) for portnum, link in enumerate(self._ports)
+                   if link is not None]
+        self._flood_links = [tuple(link for portnum, link in plugged if portnum != inport)
+                             for inport in range(self._nports)]
+
     @abstractmethod
     def rx(self, portnum: int, frame: ByteString): ...
+
+
+# asyncio variants of the classes above.  tx, rx and everything that sends a
+# frame are coroutines, and a frame has been delivered (and handled) by every
+# other node on the link when tx returns, just as with a BroadcastLink without
+# a clock.  A node waiting for a reply suspends its task instead of blocking a
+# thread, so one event loop can run a great many of them.
+
+class AsyncCommunicationsLink(CommunicationsLink):
+    @abstractmethod
+    async def tx(self, sender: Node, frame: ByteString): ...
+
+
+class AsyncBroadcastLink(BroadcastLink, AsyncCommunicationsLink):
+    async def tx(self, sender: Node, frame: ByteString):
+        assert sender in self._nodes, "BroadcastLink received frame from unattached node"
+
+        frame = self._prepare(frame)
+        if frame is None:
+            return
+        for node in list(self._nodes):
+            if node != sender:
+                await node.rx_link(self, frame)
+        self._corrupt = False
+
+
+class AsyncAdapter(Adapter):
+    """Adapter for AsyncCommunicationsLinks"""
+
+    async def rx_link(self, link: AsyncCommunicationsLink, frame: ByteString):
+        assert link is self._link, "Adapter received frame from unattached link"
+
+        await self.rx(frame)
+
+    async def tx(self, frame):
+        if self._link is None:
+            return
+        await self._link.tx(self, frame)
+
+    @abstractmethod
+    async def output(self, protonum, dst, dgram): ...
+
+    @abstractmethod
+    async def rx(self, frame: ByteString): ...
+
+    @abstractmethod
+    async def output_ip(self, protonum, addr, dgram): ...
+
+
+class AsyncMultiportNode(MultiportNode):
+    """MultiportNode for AsyncCommunicationsLinks"""
+
+    async def rx_link(self, link: AsyncCommunicationsLink, frame: ByteString):
+        inport = self._link_ports.get(link)
+        assert inport is not None, "MultiportNode received frame from unattached link"
+
+        await self.rx(inport, frame)
+
+    async def forward(self, outport: int, frame: ByteString):
+        if not 0 <= outport < self._nports:
+            raise IndexError("Invalid port number")
+
+        link = self._ports[outport]
+        if link is None:
+            return
+        await link.tx(self, frame)
+
+    async def flood(self, inport: int, frame: ByteString):
+        """Forwards the frame to every plugged-in port except inport"""
+        for link in self._flood_links[inport]:
+            await link.tx(self, frame)
+
+    @abstractmethod
+    async def rx(self, portnum: int, frame: ByteString): ...
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
-from physical import MultiportNode
+from physical import AsyncMultiportNode, MultiportNode
 
 
 class Repeater(MultiportNode):
     def rx(self, inport, frame):
-        for outport in range(self.nports):
-            if outport != inport:
-                self.forward(outport, frame)
+        self.flood(inport, frame)
+
+
+class AsyncRepeater(AsyncMultiportNode):
+    async def rx(self, inport, frame):
+        await self.flood(inport, frame)
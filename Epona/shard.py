@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+
+# Seconds a partition's poller sleeps when no frames have arrived
+POLL_INTERVAL = 0.0005
+
+
+def run_sharded(target, links, args=()):
+    """
+    Calls target(partition, *args) in its own process for every partition of
+    a topology whose partitions are joined by SharedMemoryLinks, one endpoint
+    per partition, and returns their results in partition order.  Each
+    process binds the links and polls them on a background thread, so target
+    only has to build its part of the topology and run it; blocking calls
+    such as MARE resolution work as usual.  target, args and the results are
+    pickled.
+
+    Frames reaching a partition before its nodes are plugged in are lost, so
+    targets which need the whole topology in place should wait for each
+    other, for example on a multiprocessing.Barrier passed in args.
+    """
+    partitions = links[0].endpoints
+    if any(link.endpoints != partitions for link in links):
+        raise ValueError("Links span different numbers of partitions")
+
+    context = multiprocessing.get_context()
+    results = context.Queue()
+    processes = [context.Process(target=_run_partition, args=(target, partition, links, args, results))
+                 for partition in range(partitions)]
+    outcomes = {}
+    try:
+        for process in processes:
+            process.start()
+        while len(outcomes) < partitions:
+            try:
+                partition, outcome = results.get(timeout=1)
+            except queue.Empty:
+                for partition, process in enumerate(processes):
+                    if process.exitcode not in (None, 0) and partition not in outcomes:
+                        raise RuntimeError("Partition %d exited with code %d" % (partition, process.exitcode))
+                continue
+            outcomes[partition] = outcome
+        for process in processes:
+            process.join()
+    finally:
+        # After a failure the others may be stuck waiting for the lost
+        # partition, and would otherwise hang the parent on exit
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    for partition in range(partitions):
+        failed, value = outcomes[partition]
+        if failed:
+            raise RuntimeError("Partition %d failed:\n%s" % (partition, value))
+    return [outcomes[partition][1] for partition in range(partitions)]
+
+
+def _run_partition(target, partition, links, args, results):
+    for link in links:
+        link.bind(partition)
+    stop = threading.Event()
+    poller = threading.Thread(target=_poll, args=(links, stop), daemon=True)
+    poller.start()
+    try:
+        outcome = (False, target(partition, *args))
+    except Exception:
+        outcome = (True, traceback.format_exc())
+    finally:
+        stop.set()
+        poller.join()
+        for link in links:
+            link.close()
+    results.put((partition, outcome))
+
+
+def _poll(links, stop):
+    while not stop.is_set():
+        if not sum(link.poll() for link in links):
+            time.sleep(POLL_INTERVAL)
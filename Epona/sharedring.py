@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+from multiprocessing import shared_memory
+import struct
+from typing import Optional
+
+# Default ring capacity in bytes
+RING_SIZE = 1 << 20
+
+
+class SharedRing:
+    """
+    Ring buffer of length-prefixed frames in shared memory, written by a
+    single producer and read independently by a fixed number of consumers,
+    which may live in other processes.  Every consumer sees every frame.
+
+    No locks are taken.  Positions are byte counts which only ever grow: the
+    producer alone advances head, storing it after the frame's bytes, and each
+    consumer alone advances its own cursor.  This relies on aligned 8-byte
+    stores being atomic, which holds on the platforms we run on.  When the
+    slowest consumer leaves too little room, put() drops the frame.
+
+    Pickling a ring (for example to pass it to another process) attaches to
+    the same shared memory by name rather than copying it.
+    """
+
+    # Layout: capacity, number of consumers, head, then one cursor per
+    # consumer, followed by the data area
+    HEADER = struct.Struct("=QQ")
+    POSITION = struct.Struct("=Q")
+    LENGTH = struct.Struct("=I")
+    HEAD_OFFSET = HEADER.size
+
+    def __init__(self, name=None, create=False, capacity=RING_SIZE, consumers=1):
+        if create:
+            size = self.HEADER.size + self.POSITION.size * (1 + consumers) + capacity
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+            self.HEADER.pack_into(self._shm.buf, 0, capacity, consumers)
+            self._shm.buf[self.HEAD_OFFSET:size - capacity] = bytes(size - capacity - self.HEAD_OFFSET)
+        else:
+            self._shm = shared_memory.SharedMemory(name)
+            capacity, consumers = self.HEADER.unpack_from(self._shm.buf, 0)
+        self._capacity = capacity
+        self._consumers = consumers
+        data_offset = self.HEAD_OFFSET + self.POSITION.size * (1 + consumers)
+        self._data = self._shm.buf[data_offset:data_offset + capacity]
+        # Producer's last reading of the slowest consumer's cursor.  Cursors
+        # only move forward, so the real one can only be further on, and the
+        # cursors need only be read again when this leaves too little room.
+        self._tail = None
+
+    def __reduce__(self):
+        return (SharedRing, (self.name,))
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def consumers(self):
+        return self._consumers
+
+    def put(self, frame) -> bool:
+        """Appends a frame, returning False if it was dropped for lack of room"""
+        need = self.LENGTH.size + len(frame)
+        head = self._head()
+        if self._tail is None or head + need - self._tail > self._capacity:
+            self._tail = min((self._cursor(c) for c in range(self._consumers)), default=head)
+            if head + need - self._tail > self._capacity:
+                return False
+        self._write(head, self.LENGTH.pack(len(frame)))
+        self._write(head + self.LENGTH.size, frame)
+        # Publishing the new head is what makes the frame visible
+        self.POSITION.pack_into(self._shm.buf, self.HEAD_OFFSET, head + need)
+        return True
+
+    def get(self, consumer: int) -> Optional[bytes]:
+        """Returns the consumer's next frame, or None if it has read them all"""
+        frames = self.drain(consumer, 1)
+        return frames[0] if frames else None
+
+    def drain(self, consumer: int, limit=None) -> list[bytes]:
+        """
+        Returns every frame (or at most limit frames) the consumer has not
+        read yet, freeing their space in one step.
+        """
+        if not 0 <= consumer < self._consumers:
+            raise IndexError("Invalid consumer number")
+
+        cursor = start = self._cursor(consumer)
+        head = self._head()
+        frames = []
+        while cursor < head and (limit is None or len(frames) < limit):
+            length, = self.LENGTH.unpack(self._read(cursor, self.LENGTH.size))
+            frames.append(self._read(cursor + self.LENGTH.size, length))
+            cursor += self.LENGTH.size + length
+        if cursor != start:
+            self.POSITION.pack_into(self._shm.buf, self._cursor_offset(consumer), cursor)
+        return frames
+
+    def close(self):
+        """Detaches this process from the ring"""
+        self._data.release()
+        self._shm.close()
+
+    def unlink(self):
+        """Destroys the ring once every process has closed it"""
+        self._shm.unlink()
+
+    def _head(self):
+        return self.POSITION.unpack_from(self._shm.buf, self.HEAD_OFFSET)[0]
+
+    def _cursor_offset(self, consumer):
+        return self.HEAD_OFFSET + self.POSITION.size * (1 + consumer)
+
+    def _cursor(self, consumer):
+        return self.POSITION.unpack_from(self._shm.buf, self._cursor_offset(consumer))[0]
+
+    def _write(self, pos, data):
+        ofs = pos % self._capacity
+        first = min(len(data), self._capacity - ofs)
+        self._data[ofs:ofs + first] = data[:first]
+        self._data[:len(data) - first] = data[first:]
+
+    def _read(self, pos, length):
+        ofs = pos % self._capacity
+        if ofs + length <= self._capacity:
+            return bytes(self._data[ofs:ofs + length])
+        first = self._capacity - ofs
+        return bytes(self._data[ofs:]) + bytes(self._data[:length - first])
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import heapq
+import itertools
+import os
+import threading
+import time
+import traceback
+
+# Clocks provide the three timing operations the rest of the stack needs:
+#
+#   now()                             current time in seconds
+#   call_later(delay, callback, *args)
+#                                     run callback(*args) after delay seconds,
+#                                     returning a handle with a cancel() method
+#   wait_for(cv, predicate, timeout)  block until predicate() is true or
+#                                     timeout seconds pass, with cv's lock held
+#                                     by the caller, returning predicate()
+
+
+class RealTimeClock:
+    """
+    Clock that follows the wall clock.  Waits really block, and every timer
+    runs on one shared thread, so callbacks must not block for long.
+    """
+
+    def __init__(self):
+        self._reset()
+        # The timer thread does not survive a fork
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._cv = threading.Condition()
+        # Heap of (time, sequence number, event), as in Scheduler
+        self._queue = []
+        self._seq = itertools.count()
+        self._thread = None
+
+    def now(self):
+        return time.monotonic()
+
+    def call_later(self, delay, callback, *args):
+        event = ScheduledEvent(self.now() + max(delay, 0), callback, args)
+        with self._cv:
+            heapq.heappush(self._queue, (event.time, next(self._seq), event))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='RealTimeClock', daemon=True)
+                self._thread.start()
+            self._cv.notify()
+        return event
+
+    def wait_for(self, cv, predicate, timeout=None):
+        return cv.wait_for(predicate, timeout=timeout)
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while True:
+                    if self._queue and self._queue[0][2].cancelled:
+                        heapq.heappop(self._queue)
+                    elif not self._queue:
+                        self._cv.wait()
+                    elif self._queue[0][0] > self.now():
+                        self._cv.wait(self._queue[0][0] - self.now())
+                    else:
+                        event = heapq.heappop(self._queue)[2]
+                        break
+            try:
+                event.callback(*event.args)
+            except Exception:
+                traceback.print_exc()
+
+
+# Clock used by everything which is not given one
+REAL_TIME = RealTimeClock()
+
+
+class ScheduledEvent:
+    def __init__(self, time, callback, args):
+        self.time = time
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    Discrete-event scheduler with a virtual clock.  Nothing ever sleeps: the
+    clock jumps straight to the next scheduled event, so simulated timeouts
+    cost only the CPU time needed to process the events in between.
+
+    Waiting on a Scheduler processes events until the condition holds or the
+    virtual timeout passes, which lets code written against blocking waits
+    (such as MARE resolution) run unchanged inside a single-threaded
+    simulation.
+    """
+
+    def __init__(self):
+        self._now = 0.0
+        # Heap of (time, sequence number, event); the sequence number keeps
+        # events scheduled for the same time in FIFO order
+        self._queue = []
+        self._seq = itertools.count()
+
+    def now(self):
+        return self._now
+
+    def call_later(self, delay, callback, *args):
+        event = ScheduledEvent(self._now + max(delay, 0), callback, args)
+        heapq.heappush(self._queue, (event.time, next(self._seq), event))
+        return event
+
+    def pending(self):
+        """Returns the number of events still scheduled (including cancelled ones)"""
+        return len(self._queue)
+
+    def next_time(self):
+        """Returns the time of the next live event, or None if there is none"""
+        while self._queue and self._queue[0][2].cancelled:
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def step(self):
+        """Runs the next live event, returning False if there was none"""
+        if self.next_time() is None:
+            return False
+        t, _, event = heapq.heappop(self._queue)
+        self._now = max(self._now, t)
+        event.callback(*event.args)
+        return True
+
+    def run(self, until=None):
+        """
+        Runs events in time order until none are left or, if until is given,
+        until the next one is later than that time.  The clock is then left
+        at until.
+        """
+        while True:
+            t = self.next_time()
+            if t is None or (until is not None and t > until):
+                break
+            self.step()
+        if until is not None:
+            self._now = max(self._now, until)
+
+    def wait_for(self, cv, predicate, timeout=None):
+        # Events run on the waiting caller's stack, so a wait started from
+        # inside an event nests in the one already running and cannot finish
+        # before it.  Work which must overlap in virtual time (such as
+        # background MARE retries) has to be scheduled as events instead.
+        deadline = None if timeout is None else self._now + timeout
+        while not predicate():
+            t = self.next_time()
+            if t is None or (deadline is not None and t > deadline):
+                # Nothing left can happen before the deadline
+                if deadline is not None:
+                    self._now = max(self._now, deadline)
+                return predicate()
+            self.step()
+        return True
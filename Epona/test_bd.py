@@ -126,5 +126,40 @@ class A0_BlockingDictTest(unittest.TestCase):
         thr2.join()
 
 
+    def test_10_contains(self):
+        self.assertNotIn(7, self.bd)
+        self.bd.put(7, 0)
+        self.assertIn(7, self.bd)
+        del self.bd[7]
+        self.assertNotIn(7, self.bd)
+
+    def test_11_multithread_different_keys(self):
+        results = {}
+
+        def helper(key):
+            results[key] = self.bd.get(key, timeout=1)
+
+        thrs = [Thread(target=helper, args=(key,)) for key in range(4)]
+        for thr in thrs:
+            thr.start()
+        time.sleep(0.001)
+        for key in reversed(range(4)):
+            self.bd.put(key, -key)
+        for thr in thrs:
+            thr.join()
+
+        self.assertEqual(results, {0: 0, 1: -1, 2: -2, 3: -3})
+        # No waiter bookkeeping is left behind
+        self.assertEqual(self.bd._waiting, {})
+
+
+    def test_12_backing_mapping(self):
+        data = {1: 'x'}
+        bd = BlockingDict(data)
+        self.assertEqual(bd.get(1, timeout=0), 'x')
+        bd.put(2, 'y')
+        self.assertEqual(data, {1: 'x', 2: 'y'})
+
+
 if __name__ == '__main__':
     unittest.main()
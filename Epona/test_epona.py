@@ -4,11 +4,16 @@ import sys
 import os.path
 sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
 
-from epona import EponaAdapter, EponaSwitch
+from epona import (AsyncEponaAdapter, EponaAdapter, EponaSwitch, ArpFrame, Frame, CHECKSUM_CRC32, CHECKSUM_XOR,
+                   MARE_QUEUE_LENGTH)
 from ipaddress import IPv4Address, IPv4Interface, IPv4Network
-from physical import Adapter, BroadcastLink, BROADCAST_MAC, MARE_PROTONUM
+from physical import Adapter, AsyncBroadcastLink, BroadcastLink, DatagramLink, BROADCAST_MAC, MARE_PROTONUM
+from simulation import Scheduler
+import asyncio
 import random
+from repeater import AsyncRepeater
 from test_phy import MockAdapter
+import threading
 from threading import Thread
 import time
 
@@ -24,6 +29,12 @@ def MockEponaAdapter(*args, **kwargs):
     return a
 
 
+def MockAsyncEponaAdapter(*args, **kwargs):
+    a = AsyncEponaAdapter(*args, **kwargs)
+    a.input = mock.MagicMock(name='self.input', autospec=True)
+    return a
+
+
 class A_Part1(unittest.TestCase):
     """
     Unit tests for the EponaAdapter class (link-layer addressing).
@@ -337,6 +348,158 @@ class B_Part2(unittest.TestCase):
         self.ma[4].rx.assert_called_once()
         self.ma[5].rx.assert_called_once()
 
+    def test_10_forwards_original_buffer(self):
+        """
+        Switch forwards the frame it received without re-encoding it.
+        """
+        raw = bytes(Frame(0x7777, BROADCAST_MAC, self.a.hwaddr, b'as-is').toBytes())
+        self.s1.rx(2, raw)
+        for n in (0, 1, 3, 4, 5):
+            self.assertIs(self.ma[n].rx.call_args[0][0], raw)
+
+
+    def test_11_cut_through(self):
+        """
+        Cut-through switches forward corrupted frames and count them.
+        """
+        s2 = EponaSwitch(6, cutThrough=True)
+        for n in range(6):
+            self.s1.unplug(n)
+            s2.plug(n, self.links[n])
+
+        self.links[2].corrupt_next()
+        self.a.output(0x1005, BROADCAST_MAC, b'corrupt but forwarded anyway')
+        self.assertEqual(s2.corruptFramesForwarded, 1)
+        for n in range(0, 6):
+            self.ma[n].rx.assert_called_once()
+        self.assertNotIn(self.a.hwaddr, s2.switchingTable)
+
+        # Intact frames are still switched and learned from
+        self.a.output(0x1006, BROADCAST_MAC, b'intact')
+        self.assertEqual(s2.corruptFramesForwarded, 1)
+        self.assertEqual(s2.switchingTable[self.a.hwaddr], 2)
+
+    def test_12_store_and_forward_counts_drops(self):
+        """
+        Store-and-forward switches count the corrupted frames they drop.
+        """
+        for trial in range(10):
+            self.links[2].corrupt_next()
+            self.a.output(0x1007, BROADCAST_MAC, b'dropped at the switch')
+        self.assertEqual(self.s1.corruptFramesDropped, 10)
+        self.assertEqual(self.s1.corruptFramesForwarded, 0)
+
+
+    def test_13_station_move(self):
+        """
+        Switch follows a MAC address that reappears on a different port.
+        """
+        self.a.output(0x1008, self.ma[0].hwaddr, b'here I am')
+        self.assertEqual(self.s1.switchingTable[self.a.hwaddr], 2)
+
+        self.a.plug(self.links[4])
+        self.a.output(0x1008, self.ma[0].hwaddr, b'now I am here')
+        self.assertEqual(self.s1.switchingTable[self.a.hwaddr], 4)
+        self.assertEqual(self.s1.stationMoves, 1)
+
+        for n in range(0, 6):
+            self.ma[n].rx.reset_mock()
+        self.b.output(0x1009, self.a.hwaddr, b'found you')
+        self.ma[2].rx.assert_not_called()
+        self.ma[4].rx.assert_called_once()
+
+    def test_14_mac_aging(self):
+        """
+        Switch forgets addresses once they have aged out.
+        """
+        s2 = EponaSwitch(6, macAgingTime=0)
+        for n in range(6):
+            self.s1.unplug(n)
+            s2.plug(n, self.links[n])
+
+        self.a.output(0x100a, self.ma[0].hwaddr, b'forget me')
+        for n in range(0, 6):
+            self.ma[n].rx.reset_mock()
+        self.b.output(0x100b, self.a.hwaddr, b'flooded again')
+        for n in range(0, 6):
+            self.ma[n].rx.assert_called_once()
+
+    def test_15_mac_table_size(self):
+        """
+        Switch never holds more addresses than its table size.
+        """
+        s2 = EponaSwitch(6, macTableSize=2)
+        for n in range(6):
+            self.s1.unplug(n)
+            s2.plug(n, self.links[n])
+
+        ads = [EponaAdapter(bytes((n,)) * 6, next(self.ips), self.rtr) for n in range(4)]
+        for n, ad in enumerate(ads):
+            ad.plug(self.links[n])
+            ad.output(0x100c, BROADCAST_MAC, b'remember me')
+        self.assertEqual(len(s2.switchingTable), 2)
+        self.assertNotIn(ads[0].hwaddr, s2.switchingTable)
+        self.assertIn(ads[3].hwaddr, s2.switchingTable)
+
+
+    def test_16_learn_from_unicast(self):
+        """
+        Switch learns source addresses from frames it forwards selectively.
+        """
+        # Both directions of a conversation stop flooding after one exchange
+        self.a.output(0x100d, self.b.hwaddr, b'ping')
+        self.b.output(0x100d, self.a.hwaddr, b'pong')
+        for n in range(0, 6):
+            self.ma[n].rx.reset_mock()
+
+        self.a.output(0x100d, self.b.hwaddr, b'ping again')
+        self.b.output(0x100d, self.a.hwaddr, b'pong again')
+        self.ma[0].rx.assert_not_called()
+        self.ma[1].rx.assert_not_called()
+        self.assertEqual(self.ma[2].rx.call_count, 2)
+        self.assertEqual(self.ma[3].rx.call_count, 2)
+        self.ma[4].rx.assert_not_called()
+        self.ma[5].rx.assert_not_called()
+
+
+    def test_17_mare_proxy(self):
+        """
+        A MARE proxy answers requests for hosts it has heard from instead of
+        flooding them.
+        """
+        s2 = EponaSwitch(6, mareProxy=True)
+        for n in range(6):
+            self.s1.unplug(n)
+            s2.plug(n, self.links[n])
+        c = MockEponaAdapter(bytes.fromhex('c0ffee00c0de'), next(self.ips), self.rtr)
+        c.plug(self.links[4])
+
+        # The switch hears a's address while b resolves it
+        self.b.output_ip(0x100e, self.a.iface.ip.packed, b'hello a')
+        self.assertEqual(s2.mareTable[self.a.iface.ip.packed], self.a.hwaddr)
+        for n in range(0, 6):
+            self.ma[n].rx.reset_mock()
+
+        # c's request is answered by the switch and never reaches a's link
+        c.output_ip(0x100f, self.a.iface.ip.packed, b'hello from c')
+        self.assertEqual(s2.mareRequestsAnswered, 1)
+        self.assertEqual(c.arpTable.get(self.a.iface.ip.packed, timeout=0), self.a.hwaddr)
+        self.ma[0].rx.assert_not_called()
+        self.ma[1].rx.assert_not_called()
+        self.ma[2].rx.assert_called_once()
+        self.ma[3].rx.assert_not_called()
+        self.assertEqual(self.ma[4].rx.call_count, 3)
+        self.ma[5].rx.assert_not_called()
+
+        # A unicast refresh goes through to a, which answers it itself
+        for n in range(0, 6):
+            self.ma[n].rx.reset_mock()
+        c.sendArpRequest(self.a.iface.ip.packed, self.a.hwaddr)
+        self.assertEqual(s2.mareRequestsAnswered, 1)
+        self.ma[0].rx.assert_not_called()
+        self.assertEqual(self.ma[2].rx.call_count, 2)
+        self.assertEqual(self.ma[4].rx.call_count, 2)
+
 
 class C_Part3(unittest.TestCase):
     """
@@ -377,6 +540,17 @@ class C_Part3(unittest.TestCase):
         self.c.plug(self.link)
         self.d.plug(self.link)
 
+    def asyncAdapter(self):
+        """Returns an asynchronously resolving adapter plugged into the link"""
+        e = MockEponaAdapter(
+            bytes.fromhex("1e78061448e3"),
+            IPv4Interface("10.23.41.101/21"),
+            self.rtr.iface.ip,
+            asyncResolution=True,
+        )
+        e.plug(self.link)
+        return e
+
     def test_01_output_ip(self):
         """
         IP-addressed datagrams are delivered by the correct adapter only.
@@ -433,6 +607,250 @@ class C_Part3(unittest.TestCase):
         self.c.input.assert_called_once_with(0x3252, b'in west philadelphia')
         self.d.input.assert_not_called()
 
+    def test_05_concurrent_resolution(self):
+        """
+        Resolutions of different addresses in parallel do not disturb each
+        other.
+        """
+        errors = []
+
+        def resolve_dead():
+            try:
+                self.a.output_ip(0x3254, bytes((10, 23, 41, 12)), b'nobody home')
+            except Adapter.NoRouteToHost as e:
+                errors.append(e)
+
+        thr = Thread(target=resolve_dead)
+        thr.start()
+        time.sleep(0.01)
+        start = time.perf_counter()
+        self.a.output_ip(0x3255, self.c.iface.ip.packed, b'somebody home')
+        elapsed = time.perf_counter() - start
+        thr.join()
+
+        self.assertEqual(len(errors), 1)
+        self.assertLess(elapsed, 0.1)
+        self.c.input.assert_called_once_with(0x3255, b'somebody home')
+
+    def test_06_coalesced_resolution(self):
+        """
+        Many threads resolving the same address send one request per retry.
+        """
+        dead = bytes((10, 23, 41, 13))
+        errors = []
+
+        def resolve_dead():
+            try:
+                self.a.output_ip(0x3256, dead, b'anybody home?')
+            except Adapter.NoRouteToHost as e:
+                errors.append(e)
+
+        with mock.patch.object(self.a, 'output', wraps=self.a.output) as output:
+            thrs = [Thread(target=resolve_dead) for _ in range(8)]
+            for thr in thrs:
+                thr.start()
+            for thr in thrs:
+                thr.join()
+
+        self.assertEqual(len(errors), 8)
+        self.assertEqual(output.call_count, 3)
+        self.assertEqual(self.a.pendingResolutions, {})
+
+    def test_07_async_resolution(self):
+        """
+        Asynchronous adapters return at once and send queued datagrams when
+        the MARE reply arrives.
+        """
+        e = self.asyncAdapter()
+
+        # Hold back the reply so the datagrams have to wait for it
+        with mock.patch.object(self.c, 'arpFrameRecievedProcedure'):
+            for n in range(3):
+                e.output_ip(0x3257, self.c.iface.ip.packed, b'queued %d' % n)
+            self.c.input.assert_not_called()
+            self.assertEqual(len(e.pendingPackets[self.c.iface.ip.packed]), 3)
+
+            # An unsolicited reply releases them in order
+            reply = ArpFrame(e.hwaddr, self.c.hwaddr, e.iface.ip.packed, self.c.iface.ip.packed, True)
+            self.c.output(MARE_PROTONUM, e.hwaddr, reply.toBytes())
+
+        self.c.input.assert_has_calls([mock.call(0x3257, b'queued %d' % n) for n in range(3)])
+        self.assertEqual(e.pendingPackets, {})
+
+    def test_08_async_unreachable(self):
+        """
+        Asynchronous adapters drop datagrams for unresolvable addresses instead
+        of raising.
+        """
+        e = self.asyncAdapter()
+
+        start = time.perf_counter()
+        e.output_ip(0x3258, bytes((10, 23, 41, 14)), b'lost')
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertIn(bytes((10, 23, 41, 14)), e.pendingPackets)
+
+        time.sleep(0.5)
+        self.assertEqual(e.pendingPackets, {})
+        self.assertEqual(e.datagramsDropped, 1)
+
+        # Until the hold-down passes, datagrams for it are dropped at once
+        e.output_ip(0x3258, bytes((10, 23, 41, 14)), b'lost again')
+        self.assertEqual(e.pendingPackets, {})
+        self.assertEqual(e.datagramsDropped, 2)
+
+    def test_09_mare_cache_expiry(self):
+        """
+        MARE cache entries expire and the cache never outgrows its size.
+        """
+        e = MockEponaAdapter(
+            bytes.fromhex("1e78061448e5"),
+            IPv4Interface("10.23.41.103/21"),
+            self.rtr.iface.ip,
+            mareCacheTime=0.05,
+            mareCacheSize=2,
+        )
+        e.plug(self.link)
+
+        for peer in (self.b, self.c, self.d):
+            e.output_ip(0x3259, peer.iface.ip.packed, b'cache me')
+        self.assertEqual(len(e.arpCache), 2)
+        self.assertNotIn(self.b.iface.ip.packed, e.arpTable)
+        self.assertIn(self.d.iface.ip.packed, e.arpTable)
+
+        time.sleep(0.1)
+        self.assertNotIn(self.d.iface.ip.packed, e.arpTable)
+
+    def test_10_mare_refresh(self):
+        """
+        MARE cache entries in use are refreshed by a unicast request once
+        they are near expiry, and not before.
+        """
+        sched = Scheduler()
+        e = MockEponaAdapter(
+            bytes.fromhex("1e78061448e6"),
+            IPv4Interface("10.23.41.104/21"),
+            self.rtr.iface.ip,
+            mareCacheTime=2.0,
+            clock=sched,
+        )
+        e.plug(self.link)
+
+        addr = self.c.iface.ip.packed
+        e.output_ip(0x325a, addr, b'first')
+        expiry = e.arpCache.expiry(addr)
+
+        with mock.patch.object(e, 'sendArpRequest', wraps=e.sendArpRequest) as request:
+            # A busy destination is not asked again while the entry has
+            # more than a quarter of its lifetime left
+            for n in range(1, 15):
+                sched.run(until=n / 10)
+                e.output_ip(0x325a, addr, b'busy')
+            request.assert_not_called()
+
+            sched.run(until=1.6)
+            e.output_ip(0x325a, addr, b'second')
+            e.output_ip(0x325a, addr, b'third')
+        # One refresh, sent to the cached address
+        request.assert_called_once_with(addr, self.c.hwaddr)
+        self.assertGreater(e.arpCache.expiry(addr), expiry)
+
+        # Refreshing many peers in turn keeps no more state than the cache size
+        sched = Scheduler()
+        e = MockEponaAdapter(
+            bytes.fromhex("1e78061448e7"),
+            IPv4Interface("10.23.41.105/21"),
+            self.rtr.iface.ip,
+            mareCacheTime=2.0,
+            mareCacheSize=8,
+            clock=sched,
+        )
+        for n, host in zip(range(50), IPv4Network("10.23.42.0/24").hosts()):
+            sched.run(until=2 * n)
+            e.arpCache[host.packed] = self.c.hwaddr
+            sched.run(until=2 * n + 1.6)
+            self.assertTrue(e.refreshDue(host.packed))
+        self.assertLessEqual(len(e.refreshing), 8)
+
+    def test_11_negative_cache(self):
+        """
+        Addresses that just failed to resolve fail fast without new requests,
+        until the hold-down passes or they turn up.
+        """
+        addr = bytes((10, 23, 41, 15))
+        with self.assertRaises(Adapter.NoRouteToHost):
+            self.a.output_ip(0x325b, addr, b'first try')
+
+        with mock.patch.object(self.a, 'sendArpRequest') as request:
+            start = time.perf_counter()
+            with self.assertRaises(Adapter.NoRouteToHost):
+                self.a.output_ip(0x325b, addr, b'second try')
+            self.assertLess(time.perf_counter() - start, 0.05)
+            request.assert_not_called()
+
+        # A host that appears with that address is reachable straight away
+        late = MockEponaAdapter(bytes.fromhex("1e78061448e7"), IPv4Interface((addr, 21)), self.rtr.iface.ip)
+        late.plug(self.link)
+        reply = ArpFrame(self.a.hwaddr, late.hwaddr, self.a.iface.ip.packed, addr, True)
+        late.output(MARE_PROTONUM, self.a.hwaddr, reply.toBytes())
+        self.a.output_ip(0x325b, addr, b'third try')
+        late.input.assert_called_once_with(0x325b, b'third try')
+
+    def test_12_subnet_boundaries(self):
+        """
+        Addresses at the edges of the subnet are on-link and those just past
+        them go to the gateway.
+        """
+        onlink = bytes.fromhex("aaaaaaaaaaaa")
+        self.a.arpTable[self.rtr.iface.ip.packed] = self.rtr.hwaddr
+        with mock.patch.object(self.a, 'output') as output:
+            for addr, mac in (((10, 23, 40, 0), onlink), ((10, 23, 47, 255), onlink),
+                              ((10, 23, 39, 255), self.rtr.hwaddr), ((10, 23, 48, 0), self.rtr.hwaddr)):
+                if mac == onlink:
+                    self.a.arpTable[bytes(addr)] = onlink
+                self.a.output_ip(0x325c, bytes(addr), b'edge')
+                output.assert_called_once_with(0x325c, mac, b'edge')
+                output.reset_mock()
+
+    def test_13_gratuitous_mare(self):
+        """
+        Adapters with gratuitous MARE announce themselves when plugged in, so
+        peers already on the link can reach them without asking.
+        """
+        link = BroadcastLink(name="gratuitous-link")
+        ads = [MockEponaAdapter(bytes((0x9a, n)) * 3, IPv4Interface("10.23.43.%d/21" % (n + 1)),
+                                self.rtr.iface.ip, gratuitousMare=True) for n in range(4)]
+        for ad in ads:
+            ad.plug(link)
+
+        self.assertIn(ads[3].iface.ip.packed, ads[0].arpTable)
+        with mock.patch.object(ads[0], 'sendArpRequest') as request:
+            ads[0].output_ip(0x325d, ads[3].iface.ip.packed, b'no need to ask')
+        request.assert_not_called()
+        ads[3].input.assert_called_once_with(0x325d, b'no need to ask')
+
+        # Announcements from other subnets are not cached
+        stranger = MockEponaAdapter(b'strngr', IPv4Interface("192.168.0.9/24"),
+                                    IPv4Address("192.168.0.1"), gratuitousMare=True)
+        stranger.plug(self.link)
+        self.assertNotIn(stranger.iface.ip.packed, self.a.arpTable)
+        self.assertEqual(len(self.a.arpCache), 0)
+
+    def test_14_async_burst_threads(self):
+        """
+        A burst of asynchronous resolutions to new hosts shares one timer
+        thread instead of starting a thread per host.
+        """
+        e = self.asyncAdapter()
+
+        threads = threading.active_count()
+        for n in range(100):
+            e.output_ip(0x325e, bytes((10, 23, 44, n)), b'lost')
+        self.assertLessEqual(threading.active_count(), threads + 1)
+
+        time.sleep(0.5)
+        self.assertEqual(e.pendingPackets, {})
+        self.assertEqual(e.datagramsDropped, 100)
+
 
 class D_IntegrationTests(unittest.TestCase):
     """
@@ -444,5 +862,444 @@ class D_IntegrationTests(unittest.TestCase):
         pass
 
 
+class E_FrameCodec(unittest.TestCase):
+    """
+    Unit tests for encoding and decoding EPONA frames.
+    """
+
+    def test_01_roundtrip(self):
+        """
+        A decoded frame has the same fields it was encoded with.
+        """
+        dst = bytes.fromhex('0123456789ab')
+        src = bytes.fromhex('ba9876543210')
+        frame = Frame.toFrame(Frame(0x1234, dst, src, b'round and round').toBytes())
+        self.assertTrue(frame.ConfirmChecksum())
+        self.assertEqual(frame.protocol, 0x1234)
+        self.assertEqual(frame.dstMacAdr, dst)
+        self.assertEqual(frame.sourceMacAdr, src)
+        self.assertEqual(frame.datagram, b'round and round')
+
+    def test_02_decode_is_zero_copy(self):
+        """
+        Decoded header fields and datagram are views over the received buffer.
+        """
+        raw = bytearray(Frame(0x0800, BROADCAST_MAC, b'ePoNa~', b'payload').toBytes())
+        frame = Frame.toFrame(raw)
+        self.assertIsInstance(frame.datagram, memoryview)
+        self.assertIsInstance(frame.dstMacAdr, memoryview)
+
+        # Changes to the underlying buffer are visible through the views
+        raw[-7:] = b'PAYLOAD'
+        self.assertEqual(frame.datagram, b'PAYLOAD')
+
+    def test_03_encode_layout(self):
+        """
+        Encoded frames follow the documented field layout.
+        """
+        dst = bytes.fromhex('0123456789ab')
+        src = bytes.fromhex('ba9876543210')
+        frame = Frame(0x0806, dst, src, b'laid out')
+        raw = frame.toBytes()
+        self.assertEqual(len(raw), 22 + len(b'laid out'))
+        self.assertEqual(raw[0], CHECKSUM_CRC32)
+        self.assertEqual(raw[1:6], (0x0806).to_bytes(5, "big"))
+        self.assertEqual(raw[6:12], dst)
+        self.assertEqual(raw[12:18], src)
+        self.assertEqual(raw[18:22], frame.checksum)
+        self.assertEqual(raw[22:], b'laid out')
+
+    def test_04_checksum_algorithms(self):
+        """
+        Frames verify with whichever checksum algorithm they were sent with.
+        """
+        for algorithm in (CHECKSUM_XOR, CHECKSUM_CRC32):
+            raw = Frame(0x4321, BROADCAST_MAC, b'ePoNa~', b'check me', algorithm).toBytes()
+            frame = Frame.toFrame(raw)
+            self.assertEqual(frame.checksumAlgorithm, algorithm)
+            self.assertTrue(frame.ConfirmChecksum())
+
+        # Unknown algorithms are never accepted
+        raw = Frame(0x4321, BROADCAST_MAC, b'ePoNa~', b'check me').toBytes()
+        raw[0] = 0xee
+        self.assertFalse(Frame.toFrame(raw).ConfirmChecksum())
+        with self.assertRaises(ValueError):
+            Frame(0x4321, BROADCAST_MAC, b'ePoNa~', b'check me', 0xee)
+
+    def test_05_crc32_catches_column_errors(self):
+        """
+        CRC32 detects two flips in the same bit column, which XOR cannot.
+        """
+        for algorithm, detected in ((CHECKSUM_XOR, False), (CHECKSUM_CRC32, True)):
+            raw = Frame(0x4321, BROADCAST_MAC, b'ePoNa~', b'abcdefgh', algorithm).toBytes()
+            raw[22] ^= 0x10
+            raw[25] ^= 0x10
+            self.assertEqual(not Frame.toFrame(raw).ConfirmChecksum(), detected)
+
+    def test_06_mixed_algorithms_on_link(self):
+        """
+        Adapters using different checksum algorithms interoperate.
+        """
+        link = BroadcastLink(name="checksum-link")
+        ips = (IPv4Interface((addr, TEST_NET.prefixlen)) for addr in TEST_NET.hosts())
+        rtr = next(ips)
+        a = MockEponaAdapter(b'xor-ad', next(ips), rtr, checksumAlgorithm=CHECKSUM_XOR)
+        b = MockEponaAdapter(b'crc-ad', next(ips), rtr, checksumAlgorithm=CHECKSUM_CRC32)
+        a.plug(link)
+        b.plug(link)
+        a.output(0x0123, b.hwaddr, b'from xor')
+        b.output(0x0456, a.hwaddr, b'from crc')
+        a.input.assert_called_once_with(0x0456, b'from crc')
+        b.input.assert_called_once_with(0x0123, b'from xor')
+
+    def test_07_verify_in_place(self):
+        """
+        Verifying a received frame neither mutates it nor needs a decode.
+        """
+        raw = bytes(Frame(0x5555, BROADCAST_MAC, b'ePoNa~', b'verify me').toBytes())
+        self.assertTrue(Frame.ConfirmBufferChecksum(raw))
+        frame = Frame.toFrame(raw)
+        checksum = bytes(frame.checksum)
+        self.assertTrue(frame.ConfirmChecksum())
+        self.assertTrue(frame.ConfirmChecksum())
+        self.assertEqual(frame.checksum, checksum)
+
+        # Truncated frames never verify
+        for length in range(22):
+            self.assertFalse(Frame.ConfirmBufferChecksum(raw[:length]))
+
+
+    def test_08_peek_addresses(self):
+        """
+        Addresses can be read from an encoded frame without decoding it.
+        """
+        dst = bytes.fromhex('0123456789ab')
+        src = bytes.fromhex('ba9876543210')
+        raw = Frame(0x6666, dst, src, b'x' * 4096).toBytes()
+        self.assertEqual(Frame.peekAddresses(raw), (dst, src))
+
+    def test_09_reencode_decoded(self):
+        """
+        A decoded frame encodes back to the bytes it was decoded from.
+        """
+        raw = bytes(Frame(0x7777, bytes.fromhex('0123456789ab'), b'ePoNa~', b'once more').toBytes())
+        self.assertEqual(Frame.toFrame(raw).toBytes(), raw)
+
+    def test_10_reply_to_decoded_source(self):
+        """
+        A received frame's source address can be used to send a reply.
+        """
+        link = BroadcastLink(name="reply-link")
+        ips = (IPv4Interface((addr, TEST_NET.prefixlen)) for addr in TEST_NET.hosts())
+        rtr = next(ips)
+        a = MockEponaAdapter(b'ask-me', next(ips), rtr)
+        b = MockEponaAdapter(b'answer', next(ips), rtr)
+        a.plug(link)
+        b.plug(link)
+        received = Frame.toFrame(Frame(0x0123, b.hwaddr, a.hwaddr, b'question').toBytes())
+        self.assertIsInstance(received.sourceMacAdr, memoryview)
+        b.output(0x0456, received.sourceMacAdr, b'answer')
+        a.input.assert_called_once_with(0x0456, b'answer')
+
+
+
+class F_Simulation(unittest.TestCase):
+    """
+    Tests running the EPONA stack against a simulation.Scheduler, with links
+    delivering frames as scheduled events and all timeouts in virtual time.
+    """
+
+    def setUp(self):
+        self.sched = Scheduler()
+        self.links = [BroadcastLink(name='sim-link' + str(n), clock=self.sched) for n in range(2)]
+        self.sw = EponaSwitch(2, clock=self.sched)
+        self.rtr = IPv4Address("10.23.40.1")
+        self.a = MockEponaAdapter(bytes.fromhex('5a5a5a5a5a01'), IPv4Interface("10.23.40.10/21"),
+                                  self.rtr, clock=self.sched)
+        self.b = MockEponaAdapter(bytes.fromhex('5a5a5a5a5a02'), IPv4Interface("10.23.40.20/21"),
+                                  self.rtr, clock=self.sched)
+        for n in range(2):
+            self.sw.plug(n, self.links[n])
+        self.a.plug(self.links[0])
+        self.b.plug(self.links[1])
+
+    def asyncAdapter(self):
+        """Returns an asynchronously resolving adapter plugged into b's link"""
+        c = MockEponaAdapter(bytes.fromhex('5a5a5a5a5a03'), IPv4Interface("10.23.40.30/21"),
+                             self.rtr, clock=self.sched, asyncResolution=True)
+        c.plug(self.links[1])
+        return c
+
+    def test_01_resolution_through_switch(self):
+        """
+        Address resolution completes across a switch in virtual time.
+        """
+        self.a.output_ip(0x4001, self.b.iface.ip.packed, b'simulated')
+        self.sched.run()
+        self.b.input.assert_called_once_with(0x4001, b'simulated')
+        self.assertLess(self.sched.now(), 0.1)
+
+    def test_02_many_unreachable_hosts(self):
+        """
+        A thousand resolution timeouts take virtual seconds, not real ones.
+        """
+        start = time.perf_counter()
+        for n in range(1000):
+            addr = bytes((10, 23, 44 + n // 250, n % 250))
+            with self.assertRaises(Adapter.NoRouteToHost):
+                self.a.output_ip(0x4002, addr, b'lost')
+        self.assertLess(time.perf_counter() - start, 30)
+        self.assertAlmostEqual(self.sched.now(), 1000 * 0.3)
+
+    def test_03_async_resolution(self):
+        """
+        Asynchronous resolution retries on scheduled timers.
+        """
+        c = self.asyncAdapter()
+        c.output_ip(0x4003, self.a.iface.ip.packed, b'queued')
+        c.output_ip(0x4003, bytes((10, 23, 40, 99)), b'dropped')
+        self.a.input.assert_not_called()
+        self.sched.run()
+        self.a.input.assert_called_once_with(0x4003, b'queued')
+        self.assertEqual(c.pendingPackets, {})
+
+    def test_04_concurrent_async_resolutions(self):
+        """
+        Background resolutions run side by side on the clock, each retrying
+        every MARE_TIMEOUT and giving up at 0.3 seconds.
+        """
+        c = self.asyncAdapter()
+        lost = [bytes((10, 23, 40, 100 + n)) for n in range(2)]
+        requests = []
+        sendArpRequest = c.sendArpRequest
+        def logRequest(addr, *args):
+            requests.append((round(self.sched.now(), 6), addr))
+            sendArpRequest(addr, *args)
+        c.sendArpRequest = logRequest
+
+        for addr in lost:
+            c.output_ip(0x4004, addr, b'dropped')
+        self.sched.run()
+        self.assertEqual(requests, [(t, addr) for t in (0, 0.1, 0.2) for addr in lost])
+        #Both give up at the last event, after the third timeout
+        self.assertAlmostEqual(self.sched.now(), 0.3)
+        self.assertTrue(all(addr in c.unreachable for addr in lost))
+        self.assertEqual(c.pendingPackets, {})
+
+    def test_05_queue_overflow(self):
+        """
+        Datagrams pushed out of a full queue, and those left when resolution
+        fails, are counted as dropped.
+        """
+        c = self.asyncAdapter()
+        for n in range(MARE_QUEUE_LENGTH + 2):
+            c.output_ip(0x4005, bytes((10, 23, 40, 99)), bytes((n,)))
+        self.assertEqual(c.datagramsDropped, 2)
+        self.assertEqual(c.pendingPackets[bytes((10, 23, 40, 99))][0], (0x4005, bytes((2,))))
+        self.sched.run()
+        self.assertEqual(c.datagramsDropped, MARE_QUEUE_LENGTH + 2)
+
+    def test_06_many_async_resolutions(self):
+        """
+        Hundreds of background resolutions neither nest nor stretch virtual time.
+        """
+        c = self.asyncAdapter()
+        for n in range(500):
+            c.output_ip(0x4006, bytes((10, 23, 44 + n // 250, n % 250)), b'dropped')
+        self.sched.run()
+        self.assertAlmostEqual(self.sched.now(), 0.3)
+        self.assertEqual(c.pendingPackets, {})
+
+
+class G_Threaded(unittest.TestCase):
+    """
+    Tests with every node handling frames on its own receive worker.
+    """
+
+    def setUp(self):
+        self.links = [BroadcastLink(name='thr-link' + str(n)) for n in range(2)]
+        self.sw = EponaSwitch(2)
+        self.rtr = IPv4Address("10.23.40.1")
+        self.a = MockEponaAdapter(bytes.fromhex('5a5a5a5a5b01'), IPv4Interface("10.23.40.10/21"), self.rtr)
+        self.b = MockEponaAdapter(bytes.fromhex('5a5a5a5a5b02'), IPv4Interface("10.23.40.20/21"), self.rtr)
+        for n in range(2):
+            self.sw.plug(n, self.links[n])
+        self.a.plug(self.links[0])
+        self.b.plug(self.links[1])
+        self.nodes = (self.sw, self.a, self.b)
+        for node in self.nodes:
+            node.start()
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.stop()
+
+    def drain(self):
+        # A frame handled by one node may queue frames for the others
+        while any(node._inbox.unfinished_tasks for node in self.nodes):
+            for node in self.nodes:
+                node.drain()
+
+    def test_01_resolution_through_switch(self):
+        """
+        Address resolution blocks the sender while the reply crosses worker threads.
+        """
+        self.a.output_ip(0x4101, self.b.iface.ip.packed, b'threaded')
+        self.drain()
+        self.b.input.assert_called_once_with(0x4101, b'threaded')
+
+    def test_02_concurrent_senders(self):
+        """
+        Both adapters resolve each other at the same time.
+        """
+        senders = [Thread(target=self.a.output_ip, args=(0x4102, self.b.iface.ip.packed, b'from a')),
+                   Thread(target=self.b.output_ip, args=(0x4102, self.a.iface.ip.packed, b'from b'))]
+        for t in senders:
+            t.start()
+        for t in senders:
+            t.join()
+        self.drain()
+        self.b.input.assert_called_once_with(0x4102, b'from a')
+        self.a.input.assert_called_once_with(0x4102, b'from b')
+
+
+class H_Asyncio(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests for AsyncEponaAdapter, with every host running in one event loop.
+    """
+
+    def setUp(self):
+        self.links = [AsyncBroadcastLink(name='aio-link' + str(n)) for n in range(2)]
+        self.hub = AsyncRepeater(2)
+        self.rtr = IPv4Address("10.23.40.1")
+        self.a = MockAsyncEponaAdapter(bytes.fromhex('5a5a5a5a5c01'), IPv4Interface("10.23.40.10/21"), self.rtr)
+        self.b = MockAsyncEponaAdapter(bytes.fromhex('5a5a5a5a5c02'), IPv4Interface("10.23.40.20/21"), self.rtr)
+        for n in range(2):
+            self.hub.plug(n, self.links[n])
+        self.a.plug(self.links[0])
+        self.b.plug(self.links[1])
+
+    async def test_01_resolution(self):
+        """
+        output_ip resolves the destination and delivers the datagram.
+        """
+        await self.a.output_ip(0x4201, self.b.iface.ip.packed, b'awaited')
+        self.b.input.assert_called_once_with(0x4201, b'awaited')
+        self.assertEqual(self.a.arpCache.get(self.b.ipAdr), self.b.hwaddr)
+        self.assertEqual(self.b.arpCache.get(self.a.ipAdr), self.a.hwaddr)
+        self.assertEqual(self.a.pendingResolutions, {})
+
+    async def test_02_gateway(self):
+        """
+        Off-subnet datagrams go to the gateway's MAC address.
+        """
+        rtr = MockAsyncEponaAdapter(bytes.fromhex('5a5a5a5a5c03'), IPv4Interface("10.23.40.1/21"), self.rtr)
+        rtr.plug(self.links[1])
+        await self.a.output_ip(0x4202, IPv4Address("8.8.8.8").packed, b'routed')
+        rtr.input.assert_called_once_with(0x4202, b'routed')
+        self.b.input.assert_not_called()
+
+    async def test_03_unreachable(self):
+        """
+        Resolution gives up after MARE_RETRIES timeouts, and then fails fast.
+        """
+        lost = bytes((10, 23, 40, 99))
+        with self.assertRaises(Adapter.NoRouteToHost):
+            await self.a.output_ip(0x4203, lost, b'lost')
+        self.assertIn(lost, self.a.unreachable)
+        with self.assertRaises(Adapter.NoRouteToHost):
+            await asyncio.wait_for(self.a.output_ip(0x4203, lost, b'lost'), 0.01)
+
+    async def test_04_concurrent_resolvers(self):
+        """
+        Concurrent senders to one address share a single resolution.
+        """
+        requests = []
+        sendArpRequest = self.a.sendArpRequest
+        async def countRequests(addr, *args):
+            requests.append(addr)
+            #Let the other senders start before the reply comes back
+            await asyncio.sleep(0.01)
+            await sendArpRequest(addr, *args)
+        self.a.sendArpRequest = countRequests
+
+        await asyncio.gather(*(self.a.output_ip(0x4204, self.b.ipAdr, bytes((n,))) for n in range(10)))
+        self.assertEqual(requests, [self.b.ipAdr])
+        self.assertEqual(self.b.input.call_count, 10)
+
+    async def test_05_many_waiting_resolvers(self):
+        """
+        A thousand unanswered resolutions wait together as tasks, rather than
+        taking the 300 seconds they would one after another.
+        """
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self.a.output_ip(0x4205, bytes((10, 23, 44 + n // 250, n % 250)), b'lost')
+                                         for n in range(1000)), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, Adapter.NoRouteToHost) for r in results))
+        self.assertLess(time.perf_counter() - start, 30)
+        self.assertEqual(self.a.pendingResolutions, {})
+
+    async def test_06_announce(self):
+        """
+        An awaited announcement fills in peers' caches.
+        """
+        await self.a.announce()
+        self.assertEqual(self.b.arpCache.get(self.a.ipAdr), self.a.hwaddr)
+
+    async def test_07_refresh_follows_clock(self):
+        """
+        Cache lifetimes and refreshes follow the adapter's clock, as they do
+        for EponaAdapter.
+        """
+        sched = Scheduler()
+        c = MockAsyncEponaAdapter(bytes.fromhex('5a5a5a5a5c03'), IPv4Interface("10.23.40.30/21"),
+                                  self.rtr, mareCacheTime=2.0, clock=sched)
+        c.plug(self.links[0])
+        await c.output_ip(0x4207, self.b.ipAdr, b'first')
+        self.assertEqual(c.arpCache.expiry(self.b.ipAdr), 2.0)
+
+        with mock.patch.object(c, 'sendArpRequest', wraps=c.sendArpRequest) as request:
+            sched.run(until=1.4)
+            await c.output_ip(0x4207, self.b.ipAdr, b'not yet')
+            request.assert_not_called()
+            sched.run(until=1.6)
+            await c.output_ip(0x4207, self.b.ipAdr, b'refresh')
+            await c.output_ip(0x4207, self.b.ipAdr, b'once')
+        request.assert_awaited_once_with(self.b.ipAdr, self.b.hwaddr)
+
+
+class I_Datagram(unittest.TestCase):
+    """
+    Tests with hosts joined by a DatagramLink, as if in separate processes.
+    """
+
+    def setUp(self):
+        self.links = [DatagramLink(name='udp-link' + str(n)) for n in range(2)]
+        self.links[0].connect(self.links[1].address)
+        self.links[1].connect(self.links[0].address)
+        self.rtr = IPv4Address("10.23.40.1")
+        self.a = MockEponaAdapter(bytes.fromhex('5a5a5a5a5e01'), IPv4Interface("10.23.40.10/21"), self.rtr)
+        self.b = MockEponaAdapter(bytes.fromhex('5a5a5a5a5e02'), IPv4Interface("10.23.40.20/21"), self.rtr)
+        self.a.plug(self.links[0])
+        self.b.plug(self.links[1])
+        for link in self.links:
+            link.start()
+
+    def tearDown(self):
+        for link in self.links:
+            link.close()
+
+    def test_01_resolution_over_sockets(self):
+        """
+        MARE requests and replies cross the kernel as UDP datagrams.
+        """
+        self.a.output_ip(0x4401, self.b.iface.ip.packed, b'over udp')
+        deadline = time.monotonic() + 1
+        while not self.b.input.called and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.b.input.assert_called_once_with(0x4401, b'over udp')
+        self.assertEqual(self.a.arpTable.get(self.b.ipAdr, timeout=0), self.b.hwaddr)
+
+
 if __name__ == '__main__':
     unittest.main()
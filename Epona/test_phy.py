@@ -4,9 +4,15 @@ import sys
 import os.path
 sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
 
-from physical import Adapter, BroadcastLink, CommunicationsLink, MultiportNode, Node
+from physical import (Adapter, AsyncAdapter, AsyncBroadcastLink, AsyncMultiportNode, BroadcastLink,
+                      CommunicationsLink, DatagramLink, MultiportNode, Node, SharedMemoryLink)
 
 from ipaddress import IPv4Interface, IPv4Address
+import io
+import pickle
+import tempfile
+import threading
+import time
 import unittest
 import unittest.mock as mock
 
@@ -24,6 +30,8 @@ def mocked_abstract(cls):
 
 MockAdapter = mocked_abstract(Adapter)
 MockMultiport = mocked_abstract(MultiportNode)
+MockAsyncAdapter = mocked_abstract(AsyncAdapter)
+MockAsyncMultiport = mocked_abstract(AsyncMultiportNode)
 
 
 class A0_BroadcastLinkTest(unittest.TestCase):
@@ -315,5 +323,339 @@ class A2_MultiportTest(unittest.TestCase):
             self.n.rx_link(self.link, b'test-20-plug')
 
 
+    def test_21_forward_oob(self):
+        with self.assertRaises(IndexError):
+            self.n.forward(6, b'test-21-oob')
+        with self.assertRaises(IndexError):
+            self.n.forward(-1, b'test-21-oob')
+
+    def test_22_link_on_two_ports(self):
+        self.n.plug(4, self.link)
+        self.n.plug(1, self.link)
+        self.n.rx_link(self.link, b'test22-AAA')
+        self.n.rx.assert_called_once_with(1, b'test22-AAA')
+        self.n.rx.reset_mock()
+
+        self.n.unplug(1)
+        self.n.rx_link(self.link, b'test22-BBB')
+        self.n.rx.assert_called_once_with(4, b'test22-BBB')
+
+
+    def test_23_flood(self):
+        self.n.plug(0, self.link)
+        self.n.plug(3, self.link2)
+        self.n.flood(0, b'test23-AAA')
+        self.link.tx.assert_not_called()
+        self.link2.tx.assert_called_once_with(self.n, b'test23-AAA')
+        self.link2.reset_mock()
+
+        self.n.flood(5, b'test23-BBB')
+        self.link.tx.assert_called_once_with(self.n, b'test23-BBB')
+        self.link2.tx.assert_called_once_with(self.n, b'test23-BBB')
+        self.link.reset_mock()
+        self.link2.reset_mock()
+
+        self.n.unplug(3)
+        self.n.flood(5, b'test23-CCC')
+        self.link.tx.assert_called_once_with(self.n, b'test23-CCC')
+        self.link2.tx.assert_not_called()
+
+
+class A3_RxQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.link = BroadcastLink()
+        self.mn = mock.MagicMock(name='sender', spec=Node)
+        self.link.attach(self.mn)
+        self.a = MockAdapter(bytes.fromhex('f5e5f8bd99bc'),
+                             IPv4Interface('192.168.99.81/24'),
+                             IPv4Address('192.168.99.2'))
+        self.a.plug(self.link)
+
+    def tearDown(self):
+        self.a.stop()
+
+    def test_00_synchronous_by_default(self):
+        self.link.tx(self.mn, b'test-00')
+        self.a.rx.assert_called_once_with(b'test-00')
+
+    def test_01_worker_thread(self):
+        threads = []
+        self.a.rx.side_effect = lambda frame: threads.append(threading.current_thread())
+        self.a.start()
+        self.link.tx(self.mn, b'test-01')
+        self.a.drain()
+        self.a.rx.assert_called_once_with(b'test-01')
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_02_order(self):
+        self.a.start()
+        for n in range(20):
+            self.link.tx(self.mn, bytes((n,)))
+        self.a.drain()
+        self.assertEqual([c[0][0] for c in self.a.rx.call_args_list],
+                         [bytes((n,)) for n in range(20)])
+
+    def test_03_backpressure(self):
+        entered = threading.Event()
+        release = threading.Event()
+        def rx(frame):
+            entered.set()
+            release.wait()
+        self.a.rx.side_effect = rx
+        self.a.start(maxsize=1, put_timeout=0.01)
+
+        # One frame held by the worker, one waiting in the queue, one dropped
+        self.link.tx(self.mn, b'test-03-A')
+        self.assertTrue(entered.wait(1))
+        self.link.tx(self.mn, b'test-03-B')
+        self.link.tx(self.mn, b'test-03-C')
+        self.assertEqual(self.a.rx_dropped, 1)
+
+        release.set()
+        self.a.drain()
+        self.assertEqual([c[0][0] for c in self.a.rx.call_args_list],
+                         [b'test-03-A', b'test-03-B'])
+
+    def test_04_stop(self):
+        self.a.start()
+        self.link.tx(self.mn, b'test-04-A')
+        self.a.stop()
+        self.a.rx.assert_called_once_with(b'test-04-A')
+        self.a.rx.reset_mock()
+
+        self.link.tx(self.mn, b'test-04-B')
+        self.a.rx.assert_called_once_with(b'test-04-B')
+
+    def test_05_survives_exception(self):
+        self.a.rx.side_effect = [ValueError('test-05'), None]
+        self.a.start()
+        with mock.patch('sys.stderr', new_callable=io.StringIO) as err:
+            self.link.tx(self.mn, b'test-05-A')
+            self.link.tx(self.mn, b'test-05-B')
+            self.a.drain()
+        self.assertIn('test-05', err.getvalue())
+        self.assertEqual(self.a.rx.call_count, 2)
+
+    def test_06_multiport(self):
+        n = MockMultiport(4)
+        n.plug(2, self.link)
+        n.start()
+        self.link.tx(self.mn, b'test-06')
+        n.drain()
+        n.stop()
+        n.rx.assert_called_once_with(2, b'test-06')
+
+    def test_07_send_during_stop(self):
+        release = threading.Event()
+        self.a.rx.side_effect = lambda frame: frame != b'test-07-A' or release.wait()
+        self.a.start()
+        self.link.tx(self.mn, b'test-07-A')
+        stopper = threading.Thread(target=self.a.stop)
+        stopper.start()
+        time.sleep(0.05)
+
+        # A frame sent while the worker finishes up is still handled
+        self.link.tx(self.mn, b'test-07-B')
+        release.set()
+        stopper.join()
+        self.assertCountEqual([c[0][0] for c in self.a.rx.call_args_list],
+                              [b'test-07-A', b'test-07-B'])
+
+
+class A4_AsyncTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.link = AsyncBroadcastLink()
+        self.link2 = AsyncBroadcastLink()
+        self.a = MockAsyncAdapter(bytes.fromhex('f5e5f8bd99bc'),
+                                  IPv4Interface('192.168.99.81/24'),
+                                  IPv4Address('192.168.99.2'))
+        self.b = MockAsyncAdapter(bytes.fromhex('f5e5f8bd99bd'),
+                                  IPv4Interface('192.168.99.82/24'),
+                                  IPv4Address('192.168.99.2'))
+        self.n = MockAsyncMultiport(3)
+
+    async def test_01_link_delivers(self):
+        self.a.plug(self.link)
+        self.b.plug(self.link)
+        await self.a.tx(b'test-01')
+        self.a.rx.assert_not_awaited()
+        self.b.rx.assert_awaited_once_with(b'test-01')
+
+    async def test_02_txnonbytes(self):
+        self.a.plug(self.link)
+        with self.assertRaises(TypeError):
+            await self.a.tx('test-02')
+
+    async def test_03_unplugged(self):
+        await self.a.tx(b'test-03')
+        self.b.plug(self.link)
+        self.a.plug(self.link)
+        self.a.unplug()
+        await self.b.tx(b'test-03')
+        self.a.rx.assert_not_awaited()
+
+    async def test_04_multiport_rx(self):
+        self.n.plug(2, self.link)
+        self.a.plug(self.link)
+        await self.a.tx(b'test-04')
+        self.n.rx.assert_awaited_once_with(2, b'test-04')
+
+    async def test_05_multiport_forward_flood(self):
+        self.n.plug(0, self.link)
+        self.n.plug(1, self.link2)
+        self.a.plug(self.link)
+        self.b.plug(self.link2)
+        await self.n.forward(1, b'test-05-A')
+        self.a.rx.assert_not_awaited()
+        self.b.rx.assert_awaited_once_with(b'test-05-A')
+        with self.assertRaises(IndexError):
+            await self.n.forward(3, b'test-05-oob')
+
+        await self.n.flood(1, b'test-05-B')
+        self.a.rx.assert_awaited_once_with(b'test-05-B')
+        self.assertEqual(self.b.rx.await_count, 1)
+
+
+class A5_SharedMemoryLinkTest(unittest.TestCase):
+    def setUp(self):
+        self.link = SharedMemoryLink(2)
+        # A second process would see the link as its pickled copy does
+        self.remote = pickle.loads(pickle.dumps(self.link))
+        self.link.bind(0)
+        self.remote.bind(1)
+        self.mn = mock.MagicMock(name='node 1', spec=Node)
+        self.mn2 = mock.MagicMock(name='node 2', spec=Node)
+        self.mn3 = mock.MagicMock(name='remote node', spec=Node)
+        self.link.attach(self.mn)
+        self.link.attach(self.mn2)
+        self.remote.attach(self.mn3)
+
+    def tearDown(self):
+        self.remote.close()
+        self.link.close()
+        self.link.unlink()
+
+    def test_01_local_delivery(self):
+        self.link.tx(self.mn, b'test-01')
+        self.mn.rx_link.assert_not_called()
+        self.mn2.rx_link.assert_called_once_with(self.link, b'test-01')
+        self.mn3.rx_link.assert_not_called()
+
+    def test_02_remote_delivery(self):
+        self.link.tx(self.mn, b'test-02-A')
+        self.link.tx(self.mn, b'test-02-B')
+        self.assertEqual(self.remote.poll(), 2)
+        self.assertEqual(self.mn3.rx_link.call_args_list,
+                         [mock.call(self.remote, b'test-02-A'), mock.call(self.remote, b'test-02-B')])
+        self.assertEqual(self.remote.poll(), 0)
+
+        # Frames received from another endpoint are not sent back
+        self.assertEqual(self.link.poll(), 0)
+
+    def test_03_both_ways(self):
+        self.remote.tx(self.mn3, b'test-03')
+        self.assertEqual(self.link.poll(), 1)
+        self.mn.rx_link.assert_called_once_with(self.link, b'test-03')
+        self.mn2.rx_link.assert_called_once_with(self.link, b'test-03')
+
+    def test_04_ring_full(self):
+        link = SharedMemoryLink(2, capacity=64)
+        link.bind(0)
+        link.attach(self.mn)
+        for n in range(4):
+            link.tx(self.mn, bytes((n,)) * 16)
+        self.assertEqual(link.frames_dropped, 1)
+        link.close()
+        link.unlink()
+
+    def test_05_bind_oob(self):
+        with self.assertRaises(IndexError):
+            self.link.bind(2)
+
+    def test_06_poll_limit(self):
+        for n in range(3):
+            self.link.tx(self.mn, bytes((n,)))
+        self.assertEqual(self.remote.poll(2), 2)
+        self.assertEqual(self.remote.poll(), 1)
+
+
+class A6_DatagramLinkTest(unittest.TestCase):
+    def setUp(self):
+        self.link = DatagramLink()
+        self.remote = DatagramLink(peers=[self.link.address])
+        self.link.connect(self.remote.address)
+        self.mn = mock.MagicMock(name='node 1', spec=Node)
+        self.mn2 = mock.MagicMock(name='node 2', spec=Node)
+        self.mn3 = mock.MagicMock(name='remote node', spec=Node)
+        self.link.attach(self.mn)
+        self.link.attach(self.mn2)
+        self.remote.attach(self.mn3)
+
+    def tearDown(self):
+        self.link.close()
+        self.remote.close()
+
+    def test_01_local_delivery(self):
+        self.link.tx(self.mn, b'test-01')
+        self.mn.rx_link.assert_not_called()
+        self.mn2.rx_link.assert_called_once_with(self.link, b'test-01')
+        self.assertEqual(self.link.poll(), 0)
+
+    def test_02_remote_delivery(self):
+        self.link.tx(self.mn, b'test-02-A')
+        self.link.tx(self.mn, b'test-02-B')
+        self.assertEqual(self.remote.poll(1), 2)
+        self.assertEqual(self.mn3.rx_link.call_args_list,
+                         [mock.call(self.remote, b'test-02-A'), mock.call(self.remote, b'test-02-B')])
+        self.assertEqual(self.remote.poll(), 0)
+
+    def test_03_poll_limit(self):
+        for n in range(3):
+            self.remote.tx(self.mn3, bytes((n,)))
+        self.assertEqual(self.link.poll(1, limit=2), 2)
+        self.assertEqual(self.link.poll(1), 1)
+        self.assertEqual(self.mn.rx_link.call_count, 3)
+
+    def test_04_receiver_thread(self):
+        received = threading.Event()
+        self.mn3.rx_link.side_effect = lambda link, frame: received.set()
+        self.remote.start()
+        self.link.tx(self.mn, b'test-04')
+        self.assertTrue(received.wait(1))
+        self.remote.stop()
+        self.mn3.rx_link.assert_called_once_with(self.remote, b'test-04')
+
+    def test_05_oversized(self):
+        self.link.tx(self.mn, bytes(70000))
+        self.assertEqual(self.link.frames_dropped, 1)
+        self.mn2.rx_link.assert_called_once()
+
+        # Unix datagram sockets would carry it, but peers would read it truncated
+        with tempfile.TemporaryDirectory() as tmp:
+            a = DatagramLink(os.path.join(tmp, 'a'))
+            b = DatagramLink(os.path.join(tmp, 'b'), peers=[a.address])
+            b.attach(self.mn)
+            a.attach(self.mn3)
+            b.tx(self.mn, bytes(70000))
+            self.assertEqual(b.frames_dropped, 1)
+            self.assertEqual(a.poll(0.1), 0)
+            self.mn3.rx_link.assert_not_called()
+            a.close()
+            b.close()
+
+    def test_06_unix(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            a = DatagramLink(os.path.join(tmp, 'a'))
+            b = DatagramLink(os.path.join(tmp, 'b'), peers=[a.address])
+            b.attach(self.mn)
+            a.attach(self.mn3)
+            b.tx(self.mn, b'test-06')
+            self.assertEqual(a.poll(1), 1)
+            self.mn3.rx_link.assert_called_once_with(a, b'test-06')
+            a.close()
+            b.close()
+            self.assertEqual(os.listdir(tmp), [])
+
+
 if __name__ == '__main__':
     unittest.main()
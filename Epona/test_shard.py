@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import sys
+import os.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+
+from epona import EponaAdapter, EponaSwitch
+from ipaddress import IPv4Address, IPv4Interface
+import multiprocessing
+from physical import SharedMemoryLink
+from shard import run_sharded
+import time
+
+import unittest
+
+RTR = IPv4Address("10.23.40.1")
+HOSTS = [(bytes.fromhex('5a5a5a5a5d01'), IPv4Interface("10.23.40.10/21")),
+         (bytes.fromhex('5a5a5a5a5d02'), IPv4Interface("10.23.40.20/21"))]
+
+
+def _ping(partition, links, ready):
+    """Partition 0 sends a datagram to the host in partition 1 through a switch"""
+    received = []
+    if partition == 0:
+        sw = EponaSwitch(2)
+        for n in range(2):
+            sw.plug(n, links[n])
+    a = EponaAdapter(*HOSTS[partition], RTR)
+    a.input = lambda protonum, dgram: received.append((protonum, dgram))
+    a.plug(links[partition])
+    ready.wait()
+
+    if partition == 0:
+        a.output_ip(0x4301, HOSTS[1][1].ip.packed, b'across processes')
+        return a.arpTable.get(HOSTS[1][1].ip.packed, timeout=0)
+    deadline = time.monotonic() + 5
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return received
+
+
+def _fail(partition):
+    if partition == 1:
+        raise ValueError("test-03")
+    return partition
+
+
+def _crash(partition, ready):
+    """Partition 1 dies, leaving partition 0 waiting for it"""
+    if partition == 1:
+        os._exit(3)
+    ready.wait()
+
+
+class A0_RunShardedTest(unittest.TestCase):
+    def setUp(self):
+        self.links = [SharedMemoryLink(2, name='shard-link' + str(n)) for n in range(2)]
+
+    def tearDown(self):
+        for link in self.links:
+            link.close()
+            link.unlink()
+
+    def test_01_resolution_across_processes(self):
+        """
+        An adapter resolves and reaches a host in another process, through a
+        switch in its own.
+        """
+        ready = multiprocessing.get_context().Barrier(2)
+        resolved, received = run_sharded(_ping, self.links, (self.links, ready))
+        self.assertEqual(resolved, HOSTS[1][0])
+        self.assertEqual(received, [(0x4301, b'across processes')])
+
+    def test_02_results(self):
+        self.assertEqual(run_sharded(pow, self.links, (2,)), [0, 1])
+
+    def test_03_failure(self):
+        with self.assertRaises(RuntimeError) as cm:
+            run_sharded(_fail, self.links)
+        self.assertIn('test-03', str(cm.exception))
+
+    def test_04_crash(self):
+        """
+        When a partition dies, the ones left waiting for it are stopped too.
+        """
+        ready = multiprocessing.get_context().Barrier(2)
+        with self.assertRaises(RuntimeError) as cm:
+            run_sharded(_crash, self.links, (ready,))
+        self.assertIn('exited with code 3', str(cm.exception))
+        self.assertEqual(multiprocessing.active_children(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import sys
+import os.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+
+from sharedring import SharedRing
+
+import pickle
+import unittest
+
+
+class A0_SharedRingTest(unittest.TestCase):
+    def setUp(self):
+        self.ring = SharedRing(create=True, capacity=64, consumers=2)
+
+    def tearDown(self):
+        self.ring.close()
+        self.ring.unlink()
+
+    def test_00_empty(self):
+        self.assertEqual(self.ring.get(0), None)
+        self.assertEqual(self.ring.drain(1), [])
+
+    def test_01_put_get(self):
+        self.assertTrue(self.ring.put(b'test-01'))
+        self.assertEqual(self.ring.get(0), b'test-01')
+        self.assertEqual(self.ring.get(0), None)
+
+    def test_02_every_consumer_reads(self):
+        self.ring.put(b'A')
+        self.ring.put(b'BB')
+        self.assertEqual(self.ring.drain(0), [b'A', b'BB'])
+        self.ring.put(b'CCC')
+        self.assertEqual(self.ring.drain(1), [b'A', b'BB', b'CCC'])
+        self.assertEqual(self.ring.drain(0), [b'CCC'])
+
+    def test_03_limit(self):
+        for n in range(3):
+            self.ring.put(bytes((n,)))
+        self.assertEqual(self.ring.drain(0, 2), [b'\x00', b'\x01'])
+        self.assertEqual(self.ring.drain(0), [b'\x02'])
+
+    def test_04_full(self):
+        # Each frame takes 4 bytes of length and 16 of data
+        for n in range(3):
+            self.assertTrue(self.ring.put(bytes((n,)) * 16))
+        self.assertFalse(self.ring.put(b'x' * 16))
+
+        # Room is only freed once the slowest consumer has read
+        self.ring.drain(0)
+        self.assertFalse(self.ring.put(b'x' * 16))
+        self.ring.get(1)
+        self.assertTrue(self.ring.put(b'x' * 16))
+
+    def test_05_wraparound(self):
+        for n in range(20):
+            frame = bytes((n,)) * (n % 7 + 1)
+            self.assertTrue(self.ring.put(frame))
+            self.assertEqual(self.ring.get(0), frame)
+            self.assertEqual(self.ring.get(1), frame)
+
+    def test_06_invalid_consumer(self):
+        with self.assertRaises(IndexError):
+            self.ring.get(2)
+
+    def test_07_attach_by_name(self):
+        other = SharedRing(self.ring.name)
+        self.assertEqual((other.capacity, other.consumers), (64, 2))
+        other.put(b'test-07-A')
+        self.assertEqual(self.ring.get(0), b'test-07-A')
+        other.close()
+
+        copy = pickle.loads(pickle.dumps(self.ring))
+        self.ring.put(b'test-07-B')
+        self.assertEqual(copy.get(0), b'test-07-B')
+        copy.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import sys
+import os.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+
+from blockingdict import BlockingDict
+from physical import BroadcastLink, Node
+from simulation import RealTimeClock, Scheduler
+from ttlcache import TTLCache
+import threading
+import time
+
+import unittest
+import unittest.mock as mock
+
+
+class A0_SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.sched = Scheduler()
+        self.log = []
+
+    def event(self, name):
+        self.log.append((self.sched.now(), name))
+
+    def test_00_noop(self):
+        self.assertEqual(self.sched.now(), 0)
+        self.assertFalse(self.sched.step())
+
+    def test_01_time_order(self):
+        self.sched.call_later(2, self.event, 'b')
+        self.sched.call_later(1, self.event, 'a')
+        self.sched.call_later(3, self.event, 'c')
+        self.sched.run()
+        self.assertEqual(self.log, [(1, 'a'), (2, 'b'), (3, 'c')])
+
+    def test_02_fifo_at_same_time(self):
+        for name in 'abcd':
+            self.sched.call_later(1, self.event, name)
+        self.sched.run()
+        self.assertEqual([name for _, name in self.log], list('abcd'))
+
+    def test_03_run_until(self):
+        self.sched.call_later(1, self.event, 'a')
+        self.sched.call_later(5, self.event, 'b')
+        self.sched.run(until=3)
+        self.assertEqual(self.log, [(1, 'a')])
+        self.assertEqual(self.sched.now(), 3)
+        self.sched.run()
+        self.assertEqual(self.log, [(1, 'a'), (5, 'b')])
+
+    def test_04_cancel(self):
+        ev = self.sched.call_later(1, self.event, 'a')
+        self.sched.call_later(2, self.event, 'b')
+        ev.cancel()
+        self.sched.run()
+        self.assertEqual(self.log, [(2, 'b')])
+
+    def test_05_events_schedule_events(self):
+        def chain(n):
+            self.event(n)
+            if n < 3:
+                self.sched.call_later(0.5, chain, n + 1)
+        self.sched.call_later(0, chain, 0)
+        self.sched.run()
+        self.assertEqual(self.log, [(0, 0), (0.5, 1), (1, 2), (1.5, 3)])
+
+    def test_06_wait_for_satisfied(self):
+        self.sched.call_later(0.25, self.event, 'a')
+        self.sched.call_later(10, self.event, 'b')
+        self.assertTrue(self.sched.wait_for(None, lambda: self.log, timeout=1))
+        self.assertEqual(self.sched.now(), 0.25)
+        self.assertEqual(self.log, [(0.25, 'a')])
+
+    def test_07_wait_for_timeout(self):
+        self.sched.call_later(10, self.event, 'b')
+        self.assertFalse(self.sched.wait_for(None, lambda: self.log, timeout=1))
+        self.assertEqual(self.sched.now(), 1)
+        self.assertEqual(self.log, [])
+
+    def test_08_virtual_time_is_fast(self):
+        for n in range(1000):
+            self.sched.call_later(n * 60, self.event, n)
+        start = time.perf_counter()
+        self.sched.run()
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(self.sched.now(), 999 * 60)
+
+
+class A1_ClockUsersTest(unittest.TestCase):
+    def setUp(self):
+        self.sched = Scheduler()
+
+    def test_01_blockingdict(self):
+        bd = BlockingDict(clock=self.sched)
+        self.sched.call_later(0.5, bd.put, 'k', 'v')
+        self.assertEqual(bd.get('k', timeout=1), 'v')
+        self.assertEqual(self.sched.now(), 0.5)
+
+        self.assertEqual(bd.get('nope', 'default', timeout=2), 'default')
+        self.assertEqual(self.sched.now(), 2.5)
+
+    def test_02_ttlcache(self):
+        cache = TTLCache(ttl=10, timer=self.sched.now)
+        cache['k'] = 'v'
+        self.sched.run(until=9)
+        self.assertIn('k', cache)
+        self.sched.run(until=10)
+        self.assertNotIn('k', cache)
+
+    def test_03_broadcastlink(self):
+        link = BroadcastLink(clock=self.sched)
+        mn = mock.MagicMock(name='node 1', spec=Node)
+        mn2 = mock.MagicMock(name='node 2', spec=Node)
+        link.attach(mn)
+        link.attach(mn2)
+
+        link.tx(mn, b'scheduled')
+        mn2.rx_link.assert_not_called()
+        self.sched.run()
+        mn.rx_link.assert_not_called()
+        mn2.rx_link.assert_called_once_with(link, b'scheduled')
+
+
+class A2_LinkModelTest(unittest.TestCase):
+    def setUp(self):
+        self.sched = Scheduler()
+        self.arrivals = []
+        self.mn = mock.MagicMock(name='node 1', spec=Node)
+        self.mn2 = mock.MagicMock(name='node 2', spec=Node)
+        self.mn2.rx_link.side_effect = lambda link, frame: self.arrivals.append((self.sched.now(), frame))
+
+    def make_link(self, **kwargs):
+        link = BroadcastLink(clock=self.sched, **kwargs)
+        link.attach(self.mn)
+        link.attach(self.mn2)
+        return link
+
+    def test_01_requires_clock(self):
+        with self.assertRaises(ValueError):
+            BroadcastLink(latency=0.1)
+        with self.assertRaises(ValueError):
+            BroadcastLink(bandwidth=1000)
+        with self.assertRaises(ValueError):
+            BroadcastLink(queue_limit=4)
+
+    def test_02_latency(self):
+        link = self.make_link(latency=0.25)
+        link.tx(self.mn, b'a')
+        link.tx(self.mn, b'b')
+        self.sched.run()
+        self.assertEqual(self.arrivals, [(0.25, b'a'), (0.25, b'b')])
+
+    def test_03_serialization(self):
+        # 8000 bits per second makes every byte take a millisecond
+        link = self.make_link(latency=0.5, bandwidth=8000)
+        link.tx(self.mn, b'x' * 100)
+        link.tx(self.mn, b'y' * 200)
+        self.sched.run()
+        self.assertEqual([frame[:1] for _, frame in self.arrivals], [b'x', b'y'])
+        self.assertAlmostEqual(self.arrivals[0][0], 0.6)
+        self.assertAlmostEqual(self.arrivals[1][0], 0.8)
+
+    def test_04_tail_drop(self):
+        link = self.make_link(bandwidth=8000, queue_limit=3)
+        for n in range(5):
+            link.tx(self.mn, bytes((n,)) * 10)
+        self.assertEqual(link.frames_dropped, 2)
+        self.sched.run()
+        self.assertEqual([frame[0] for _, frame in self.arrivals], [0, 1, 2])
+        self.assertEqual(link.frames_sent, 3)
+        self.assertEqual(link.bytes_sent, 30)
+
+        # The queue drains, making room again
+        link.tx(self.mn, b'again')
+        self.sched.run()
+        self.assertEqual(self.arrivals[-1][1], b'again')
+
+
+class A3_RealTimeClockTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = RealTimeClock()
+        self.log = []
+        self.done = threading.Event()
+
+    def test_01_time_order(self):
+        self.clock.call_later(0.03, self.log.append, 'c')
+        self.clock.call_later(0.01, self.log.append, 'a')
+        self.clock.call_later(0.02, self.log.append, 'b')
+        self.clock.call_later(0.04, self.done.set)
+        self.assertTrue(self.done.wait(1))
+        self.assertEqual(self.log, ['a', 'b', 'c'])
+
+    def test_02_cancel(self):
+        self.clock.call_later(0.01, self.log.append, 'a').cancel()
+        self.clock.call_later(0.02, self.done.set)
+        self.assertTrue(self.done.wait(1))
+        self.assertEqual(self.log, [])
+
+    def test_03_one_thread(self):
+        threads = threading.active_count()
+        for n in range(100):
+            self.clock.call_later(0.01, self.log.append, n)
+        self.assertEqual(threading.active_count(), threads + 1)
+        self.clock.call_later(0.02, self.done.set)
+        self.assertTrue(self.done.wait(1))
+        self.assertEqual(self.log, list(range(100)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import sys
+import os.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+
+from ttlcache import TTLCache
+
+import unittest
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class A0_TTLCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.cache = TTLCache(maxsize=3, ttl=10, timer=self.timer)
+
+    def test_01_put_get(self):
+        self.cache.put(3, 8)
+        self.assertEqual(self.cache.get(3), 8)
+        self.assertEqual(self.cache[3], 8)
+        self.assertIn(3, self.cache)
+
+    def test_02_get_not_present(self):
+        self.assertEqual(self.cache.get(5), None)
+        self.assertEqual(self.cache.get(5, 18), 18)
+        self.assertNotIn(5, self.cache)
+        with self.assertRaises(KeyError):
+            self.cache[5]
+
+    def test_03_expires(self):
+        self.cache[1] = 'a'
+        self.timer.now = 9.5
+        self.assertEqual(self.cache.get(1), 'a')
+        self.timer.now = 10
+        self.assertEqual(self.cache.get(1), None)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_04_put_refreshes_expiry(self):
+        self.cache[1] = 'a'
+        self.timer.now = 8
+        self.cache[1] = 'b'
+        self.assertEqual(self.cache.expiry(1), 18)
+        self.timer.now = 15
+        self.assertEqual(self.cache.get(1), 'b')
+
+    def test_05_get_does_not_refresh_expiry(self):
+        self.cache[1] = 'a'
+        self.timer.now = 8
+        self.cache.get(1)
+        self.assertEqual(self.cache.expiry(1), 10)
+
+    def test_06_lru_eviction(self):
+        self.cache[1] = 'a'
+        self.cache[2] = 'b'
+        self.cache[3] = 'c'
+        # Using 1 makes 2 the least recently used
+        self.cache.get(1)
+        self.cache[4] = 'd'
+        self.assertIn(1, self.cache)
+        self.assertNotIn(2, self.cache)
+        self.assertIn(3, self.cache)
+        self.assertIn(4, self.cache)
+
+    def test_07_expired_evicted_first(self):
+        self.cache[1] = 'a'
+        self.timer.now = 5
+        self.cache[2] = 'b'
+        self.cache[3] = 'c'
+        self.cache.get(1)
+        self.timer.now = 11
+        # 1 is the most recently used but has expired, so it goes instead of 2
+        self.cache[4] = 'd'
+        self.assertNotIn(1, self.cache)
+        self.assertIn(2, self.cache)
+
+    def test_08_unbounded(self):
+        cache = TTLCache(timer=self.timer)
+        for n in range(1000):
+            cache[n] = n
+        self.timer.now = 1e9
+        self.assertEqual(len(cache), 1000)
+        self.assertEqual(cache.get(0), 0)
+        self.assertEqual(cache.expiry(0), None)
+
+    def test_09_pop_del(self):
+        self.cache[1] = 'a'
+        self.cache[2] = 'b'
+        self.assertEqual(self.cache.pop(1), 'a')
+        self.assertEqual(self.cache.pop(1, 'gone'), 'gone')
+        del self.cache[2]
+        self.assertEqual(len(self.cache), 0)
+
+    def test_10_expired_after_removals(self):
+        self.cache[1] = 'a'
+        self.cache[2] = 'b'
+        self.timer.now = 5
+        self.cache[3] = 'c'
+        del self.cache[1]
+        self.cache.pop(2)
+        self.timer.now = 6
+        self.cache[1] = 'd'
+        self.cache[2] = 'e'
+        self.timer.now = 15
+        # Only 3 has expired, and it is the one making room
+        self.cache[4] = 'f'
+        self.assertEqual(len(self.cache), 3)
+        self.assertNotIn(3, self.cache)
+        self.assertEqual(self.cache.get(1), 'd')
+
+    def test_11_expire(self):
+        for n in range(3):
+            self.timer.now = n
+            self.cache[n] = n
+        self.timer.now = 11.5
+        self.cache.expire()
+        self.assertEqual(len(self.cache), 1)
+        self.assertIn(2, self.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Dictionary whose entries expire a fixed time after they were last stored
+    and which holds at most maxsize entries, evicting the least recently used
+    one to make room.  Either limit may be None to disable it.
+    """
+
+    def __init__(self, maxsize=None, ttl=None, *, timer=time.monotonic):
+        # Ordered from least to most recently used; values are (value, expiry)
+        self._data = OrderedDict()
+        # The same keys ordered from least to most recently stored.  Every
+        # entry lives for the same ttl, so this is also their order of expiry
+        # and expired entries can be found at the front without a scan.
+        self._stored = OrderedDict()
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._timer = timer
+        self._lock = threading.RLock()
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    # Implements "key in cache" (does not count as a use)
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    # Implements "len(cache)" (may include expired entries not yet purged)
+    def __len__(self):
+        return len(self._data)
+
+    # Implements "cache[key]"
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                raise KeyError(key)
+            self._data.move_to_end(key)
+            return entry[0]
+
+    # Implements "cache[key] = value"
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    # Implements "del cache[key]"
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+            self._stored.pop(key, None)
+
+    def put(self, key, value):
+        with self._lock:
+            expiry = None if self._ttl is None else self._timer() + self._ttl
+            self._data[key] = (value, expiry)
+            self._data.move_to_end(key)
+            if expiry is not None:
+                self._stored[key] = None
+                self._stored.move_to_end(key)
+            if self._maxsize is not None and len(self._data) > self._maxsize:
+                # An expired entry makes room before the least recently used live one
+                self._expire_one()
+                while len(self._data) > self._maxsize:
+                    key, _ = self._data.popitem(last=False)
+                    self._stored.pop(key, None)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return default
+            del self._data[key]
+            self._stored.pop(key, None)
+            return entry[0]
+
+    def expiry(self, key):
+        """
+        Returns the time at which the entry for key expires, or None if there
+        is no such entry or it never expires.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            return None if entry is None else entry[1]
+
+    def expire(self):
+        """
+        Removes every expired entry.
+        """
+        with self._lock:
+            while self._expire_one():
+                pass
+
+    def _expire_one(self):
+        # Removes the entry stored longest ago if it has expired
+        if not self._stored:
+            return False
+        key = next(iter(self._stored))
+        if self._data[key][1] > self._timer():
+            return False
+        del self._data[key]
+        del self._stored[key]
+        return True
+
+    def _lookup(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self._timer():
+            del self._data[key]
+            del self._stored[key]
+            return None
+        return entry